@@ -1,40 +1,238 @@
 import asyncio
+import heapq
+import itertools
 import logging
+import math
+import os
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set, Tuple
+from pymongo import UpdateOne
+from broadcast_bus import TIMER_CHANNEL
 from websocket_manager import manager
+from wire_format import Frame
+from bid_book import BID_WRITE_RETRY_MAX_SECONDS, bid_books
+from proxy_bidding import proxy_engine
+from budget_ledger import budget_ledgers
+from timer_lease import shard_of, timer_leases
 
 logger = logging.getLogger(__name__)
 
+# Clients count down locally from timer_sync frames; set to keep the old timer_update tick cadence for old clients
+AUCTION_TIMER_LEGACY_TICKS = os.environ.get('AUCTION_TIMER_LEGACY_TICKS', 'false').lower() in ('1', 'true', 'yes')
+# Seconds-remaining marks announced with a warning and a fresh timer_sync
+WARNING_SECONDS = (30, 10)
+# Most auctions ended with one aggregation and one bulk write, when many expire together or on recovery
+SETTLEMENT_BATCH_SIZE = int(os.environ.get('AUCTION_SETTLEMENT_BATCH_SIZE', '200'))
+
 class AuctionTimer:
-    def __init__(self):
-        self.active_timers: Dict[str, asyncio.Task] = {}
+    """Drives the countdown of every live auction from one task.
+
+    Each auction has a single entry in a min-heap keyed on its next
+    wake-up (monotonic clock). A wake-up works out what is due from the
+    auction's current deadline, so an extension only has to move the
+    deadline; stale heap entries are skipped by generation number.
+
+    Every process knows every live auction's deadline, kept in step by
+    control messages on the broadcast bus, but only the holder of the
+    auction's shard lease wakes it up, warns and ends it.
+    """
+
+    def __init__(self, legacy_ticks: bool = AUCTION_TIMER_LEGACY_TICKS, leases=timer_leases):
+        self.legacy_ticks = legacy_ticks
+        self.leases = leases
         self.auction_data: Dict[str, dict] = {}
+        self._heap: List[Tuple[float, int, str, int]] = []  # (wake_at, tiebreak, auction_id, generation)
+        self._counter = itertools.count()
+        self._generations = itertools.count(1)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._scheduler: Optional[asyncio.Task] = None
+        self._db = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._end_time_writes: Dict[str, asyncio.Task] = {}
+        self.stats = {"wakeups": 0, "ticks": 0, "syncs": 0, "ended": 0, "control_messages": 0,
+                      "total_lag": 0.0, "max_lag": 0.0, "settlement_batches": 0, "largest_batch": 0,
+                      "total_settle": 0.0, "max_settle": 0.0}
+        
+    async def start(self, db):
+        """Join the other processes' timers: take shard leases, then rebuild the schedule from Mongo"""
+        self._db = db
+        manager.bus.route(TIMER_CHANNEL, self._on_control)
+        await self.leases.start(db)
+        # Shards gained from now on are takeovers from another process. Hooked up before
+        # the full recovery, whose scan may already be past a shard taken over during it
+        self.leases.on_acquired = self._shards_acquired
+        await self.recover(db)
         
     async def start_auction_timer(self, auction_id: str, duration_seconds: int, db):
         """Start countdown timer for an auction"""
-        if auction_id in self.active_timers:
-            self.active_timers[auction_id].cancel()
-            
+        self._db = db
+        start_time = datetime.utcnow()
+        end_time = start_time + timedelta(seconds=duration_seconds)
+        self._track(auction_id, start_time, end_time)
+        await self._publish_control({
+            "type": "timer_start",
+            "auction_id": auction_id,
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat()
+        })
+        
+        logger.info(f"Started timer for auction {auction_id} - {duration_seconds} seconds")
+        
+    def _track(self, auction_id: str, start_time: datetime, end_time: datetime):
+        """Schedule an auction against its wall-clock end time; one already known only has its end time moved out"""
+        if auction_id in self.auction_data:
+            self._move_deadline(auction_id, end_time)
+            return
+        now = time.monotonic()
         self.auction_data[auction_id] = {
-            "duration": duration_seconds,
-            "start_time": datetime.utcnow(),
-            "end_time": datetime.utcnow() + timedelta(seconds=duration_seconds),
+            "duration": round((end_time - start_time).total_seconds()),
+            "start_time": start_time,
+            "end_time": end_time,
+            "deadline": now + (end_time - datetime.utcnow()).total_seconds(),
+            "generation": next(self._generations),
             "is_active": True
         }
+        if self.leases.owns(auction_id):
+            self._schedule(auction_id, self._first_wake(self.auction_data[auction_id], now))
+            
+    def _move_deadline(self, auction_id: str, end_time: datetime) -> bool:
+        """Push an auction's end time out to end_time; earlier times are ignored"""
+        data = self.auction_data[auction_id]
+        if end_time <= data["end_time"]:
+            return False
+        data["end_time"] = end_time
+        data["deadline"] = time.monotonic() + (end_time - datetime.utcnow()).total_seconds()
+        data["duration"] = round((end_time - data["start_time"]).total_seconds())
+        bid_books.extend(auction_id, end_time)
+        return True
         
-        # Start the timer task
-        task = asyncio.create_task(self._run_timer(auction_id, duration_seconds, db))
-        self.active_timers[auction_id] = task
+    async def recover(self, db, shards: Optional[Set[int]] = None) -> dict:
+        """Rebuild the schedule from the active auctions in Mongo after a restart or lease takeover.
         
-        logger.info(f"Started timer for auction {auction_id} - {duration_seconds} seconds")
+        Auctions whose end_time passed while no timer was running are ended
+        straight away; the rest resume counting down to their stored end_time.
+        Only auctions this process owns are ended, and only those in `shards` if given.
+        """
+        self._db = db
+        now = datetime.utcnow()
+        resumed = 0
+        expired = []
+        cursor = db.auctions.find(
+            {"is_active": True, "end_time": {"$ne": None}},
+            {"_id": 0, "id": 1, "start_time": 1, "end_time": 1}
+        )
+        async for auction in cursor:
+            auction_id = auction["id"]
+            if shards is not None and shard_of(auction_id, self.leases.shards) not in shards:
+                continue
+            if auction["end_time"] <= now:
+                if self.leases.owns(auction_id):
+                    expired.append(auction_id)
+                continue
+            if auction_id in self.auction_data:
+                self._move_deadline(auction_id, auction["end_time"])
+                continue
+            self._track(auction_id, auction.get("start_time") or now, auction["end_time"])
+            resumed += 1
+            
+        await self._end_auctions(expired, db)
+        
+        logger.info(f"Recovered auction timers: {resumed} resumed, {len(expired)} ended during downtime")
+        return {"resumed": resumed, "expired": len(expired)}
         
-    async def extend_auction_timer(self, auction_id: str, additional_seconds: int):
+    async def _shards_acquired(self, shards: Set[int]):
+        """Take over the countdowns of shards whose lease this process just gained"""
+        now = time.monotonic()
+        for auction_id, data in self.auction_data.items():
+            if shard_of(auction_id, self.leases.shards) in shards:
+                # A fresh generation retires heap entries left from an earlier ownership
+                data["generation"] = next(self._generations)
+                self._schedule(auction_id, self._first_wake(data, now))
+        if self._db is not None:
+            # The previous owner may have died with auctions past their deadline
+            await self.recover(self._db, shards)
+            
+    async def _publish_control(self, message: dict):
+        await manager.bus.publish(TIMER_CHANNEL, Frame(message))
+        
+    def _on_control(self, channel: str, frame: Frame, droppable: bool):
+        """Apply another process's timer change; this process's own changes arrive as no-ops"""
+        self.stats["control_messages"] += 1
+        message = frame.message
+        auction_id = message.get("auction_id")
+        try:
+            if message["type"] == "timer_start":
+                self._track(auction_id, datetime.fromisoformat(message["start_time"]), datetime.fromisoformat(message["end_time"]))
+            elif message["type"] == "timer_extend":
+                if auction_id in self.auction_data:
+                    self._move_deadline(auction_id, datetime.fromisoformat(message["end_time"]))
+            elif message["type"] == "timer_end":
+                for auction_id in message["auction_ids"]:
+                    self._forget(auction_id)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Invalid timer control message {message}: {e}")
+            
+    def _reschedule(self, auction_id: str, end_time: datetime):
+        """Resume the countdown of an auction that was about to end"""
+        self._move_deadline(auction_id, end_time)
+        data = self.auction_data[auction_id]
+        # Re-derive the deadline from the stored end_time even if it was already known
+        data["deadline"] = time.monotonic() + (data["end_time"] - datetime.utcnow()).total_seconds()
+        data["is_active"] = True
+        data["generation"] = next(self._generations)
+        # Its book was closed; the next bid reloads it from Mongo with the new end_time
+        bid_books.remove(auction_id)
+        self._schedule(auction_id, self._first_wake(data, time.monotonic()))
+        
+    def _forget(self, auction_id: str):
+        self.auction_data.pop(auction_id, None)
+        bid_books.remove(auction_id)
+        proxy_engine.remove(auction_id)
+        
+    def _first_wake(self, data: dict, now: float) -> float:
+        """When an auction that has just been scheduled is first due"""
+        if self.legacy_ticks:
+            return now  # its first tick goes out straight away
+        # With local countdowns nothing is sent before the next warning mark, so don't wake for it
+        seconds = math.ceil(data["deadline"] - now - 0.001)
+        if seconds <= 0 or seconds in WARNING_SECONDS:
+            return now
+        return data["deadline"] - next((mark for mark in WARNING_SECONDS if mark < seconds), 0)
+        
+    def _schedule(self, auction_id: str, wake_at: float):
+        if self._scheduler is None or self._scheduler.done():
+            self._wakeup = asyncio.Event()
+            self._scheduler = asyncio.create_task(self._run_scheduler())
+        generation = self.auction_data[auction_id]["generation"]
+        if not self._heap or wake_at < self._heap[0][0]:
+            self._wakeup.set()  # the scheduler is sleeping until a later wake-up
+        heapq.heappush(self._heap, (wake_at, next(self._counter), auction_id, generation))
+        
+    async def extend_auction_timer(self, auction_id: str, additional_seconds: int, db=None):
         """Extend auction timer (e.g., when new bid is placed)"""
         if auction_id in self.auction_data:
             current_data = self.auction_data[auction_id]
-            current_data["end_time"] += timedelta(seconds=additional_seconds)
-            current_data["duration"] += additional_seconds
+            self._move_deadline(auction_id, current_data["end_time"] + timedelta(seconds=additional_seconds))
+            
+            # Persist the new deadline so conditional bid writes see the extension
+            # and a restarted process recovers the timer exactly. A book checks
+            # bids against its own end_time, so only atomic mode waits for Mongo.
+            db = db if db is not None else self._db
+            if db is not None:
+                if bid_books.mode == "atomic":
+                    await self._write_end_time(auction_id, current_data["end_time"], db)
+                elif auction_id not in self._end_time_writes:
+                    task = asyncio.create_task(self._persist_end_time(auction_id, db))
+                    self._end_time_writes[auction_id] = task
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            # The owning process may be another one
+            await self._publish_control({
+                "type": "timer_extend",
+                "auction_id": auction_id,
+                "end_time": current_data["end_time"].isoformat()
+            })
             
             # Broadcast timer update
             await manager.broadcast_to_auction(auction_id, {
@@ -43,63 +241,200 @@ class AuctionTimer:
                 "additional_seconds": additional_seconds,
                 "new_end_time": current_data["end_time"].isoformat()
             })
+            await manager.broadcast_to_auction(auction_id, self.sync_message(auction_id))
             
             logger.info(f"Extended auction {auction_id} by {additional_seconds} seconds")
             
-    async def _run_timer(self, auction_id: str, duration_seconds: int, db):
-        """Run the countdown timer and broadcast updates"""
+    async def _write_end_time(self, auction_id: str, end_time: datetime, db):
+        await db.auctions.update_one({"id": auction_id}, {"$max": {"end_time": end_time}})
+
+    async def _persist_end_time(self, auction_id: str, db):
+        """Write an auction's end time in the background; extensions made meanwhile are folded into the next write"""
+        written = None
+        delay = 0.1
         try:
-            remaining = duration_seconds
+            while auction_id in self.auction_data:
+                end_time = self.auction_data[auction_id]["end_time"]
+                if written is not None and end_time <= written:
+                    break
+                try:
+                    await self._write_end_time(auction_id, end_time, db)
+                    written = end_time
+                except Exception as e:
+                    logger.error(f"Error persisting end time of auction {auction_id}, retrying in {delay:.1f}s: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, BID_WRITE_RETRY_MAX_SECONDS)
+        finally:
+            self._end_time_writes.pop(auction_id, None)
             
-            while remaining > 0 and auction_id in self.auction_data:
-                # Broadcast time remaining every 5 seconds, or every second in final 10 seconds
-                broadcast_interval = 1 if remaining <= 10 else 5
-                
-                await manager.broadcast_to_auction(auction_id, {
-                    "type": "timer_update",
-                    "auction_id": auction_id,
-                    "time_remaining": remaining,
-                    "total_duration": duration_seconds
-                })
-                
-                # Special notifications
-                if remaining == 30:
-                    await manager.broadcast_to_auction(auction_id, {
-                        "type": "timer_warning",
-                        "message": "30 seconds remaining!",
-                        "auction_id": auction_id
-                    })
-                elif remaining == 10:
-                    await manager.broadcast_to_auction(auction_id, {
-                        "type": "timer_final_warning",
-                        "message": "Final 10 seconds!",
-                        "auction_id": auction_id
-                    })
-                
-                await asyncio.sleep(broadcast_interval)
-                remaining -= broadcast_interval
+    def sync_message(self, auction_id: str) -> Optional[dict]:
+        """timer_sync frame: the authoritative deadline and the server's clock, for a local countdown"""
+        data = self.auction_data.get(auction_id)
+        if data is None:
+            return None
+        self.stats["syncs"] += 1
+        # Derive the wall-clock deadline from the monotonic one the scheduler actually uses
+        server_time = datetime.utcnow()
+        remaining = max(0.0, data["deadline"] - time.monotonic())
+        return {
+            "type": "timer_sync",
+            "auction_id": auction_id,
+            "end_time": (server_time + timedelta(seconds=remaining)).isoformat(),
+            "server_time": server_time.isoformat(),
+            "time_remaining": round(remaining, 3),
+            "total_duration": data["duration"]
+        }
+        
+    async def _run_scheduler(self):
+        """Sleep until the earliest wake-up, then handle every auction that is due"""
+        while True:
+            try:
+                if not self._heap:
+                    await self._wakeup.wait()
+                    self._wakeup.clear()
+                    continue
+                    
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                    continue
+                    
+                now = time.monotonic()
+                broadcasts = []
+                expired = []
+                while self._heap and self._heap[0][0] <= now:
+                    wake_at, _, auction_id, generation = heapq.heappop(self._heap)
+                    data = self.auction_data.get(auction_id)
+                    if data is None or data["generation"] != generation:
+                        continue  # stopped or restarted since this entry was pushed
+                    if not self.leases.owns(auction_id):
+                        continue  # another process holds the lease now
+                    lag = now - wake_at
+                    self.stats["wakeups"] += 1
+                    self.stats["total_lag"] += lag
+                    self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+                    if data["deadline"] <= now:
+                        data["is_active"] = False
+                        expired.append(auction_id)
+                        continue
+                    broadcasts.extend(self._advance(auction_id, data, now))
+                    
+                # Lots that expired on the same wake-up are settled together
+                if expired:
+                    task = asyncio.create_task(self._end_auctions(expired, self._db))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    
+                # Broadcasts are awaited one by one; wrapping thousands in tasks would cost more than they do
+                for broadcast in broadcasts:
+                    await broadcast
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in auction scheduler: {e}")
                 
-            # Auction ended
-            await self._end_auction(auction_id, db)
+    def _advance(self, auction_id: str, data: dict, now: float) -> list:
+        """Fire what is due for one auction and schedule its next wake-up"""
+        remaining = data["deadline"] - now
+        # Whole seconds left; a wake-up a hair early must not report an extra second
+        seconds = max(1, math.ceil(remaining - 0.001))
+        messages = []
+        if self.legacy_ticks:
+            self.stats["ticks"] += 1
+            messages.append({
+                "type": "timer_update",
+                "auction_id": auction_id,
+                "time_remaining": seconds,
+                "total_duration": data["duration"]
+            })
+        elif seconds in WARNING_SECONDS:
+            # Re-anchor local countdowns where drift would matter most
+            messages.append(self.sync_message(auction_id))
+        
+        # Special notifications
+        if seconds == 30:
+            messages.append({
+                "type": "timer_warning",
+                "message": "30 seconds remaining!",
+                "auction_id": auction_id
+            })
+        elif seconds == 10:
+            messages.append({
+                "type": "timer_final_warning",
+                "message": "Final 10 seconds!",
+                "auction_id": auction_id
+            })
             
-        except asyncio.CancelledError:
-            logger.info(f"Timer for auction {auction_id} was cancelled")
-        except Exception as e:
-            logger.error(f"Error in auction timer for {auction_id}: {e}")
+        if self.legacy_ticks:
+            # Broadcast time remaining on 5 second marks, or every second in final 10 seconds
+            next_seconds = seconds - 1 if seconds <= 10 else max(10, (seconds - 1) // 5 * 5)
+        else:
+            # Only the warning marks and the deadline need a wake-up
+            next_seconds = next((mark for mark in WARNING_SECONDS if mark < seconds), 0)
+        heapq.heappush(self._heap, (data["deadline"] - next_seconds, next(self._counter), auction_id, data["generation"]))
+        return [manager.broadcast_to_auction(auction_id, message) for message in messages]
             
-    async def _end_auction(self, auction_id: str, db):
-        """End the auction and determine winner"""
-        try:
-            # Get auction data from database
-            auction = await db.auctions.find_one({"id": auction_id})
-            if not auction:
-                return
-                
-            # Get highest bid
-            highest_bid = await db.bids.find_one(
-                {"auction_id": auction_id, "is_winning": True}
-            )
+    async def _end_auctions(self, auction_ids: List[str], db):
+        """End auctions and determine their winners, SETTLEMENT_BATCH_SIZE at a time"""
+        for i in range(0, len(auction_ids), SETTLEMENT_BATCH_SIZE):
+            batch = auction_ids[i:i + SETTLEMENT_BATCH_SIZE]
+            started = time.perf_counter()
+            try:
+                await self._settle_batch(batch, db)
+            except Exception as e:
+                logger.error(f"Error ending auctions {batch}: {e}")
+            elapsed = time.perf_counter() - started
+            self.stats["settlement_batches"] += 1
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+            self.stats["total_settle"] += elapsed
+            self.stats["max_settle"] = max(self.stats["max_settle"], elapsed)
             
+    async def _settle_batch(self, auction_ids: List[str], db):
+        """One aggregation for the auctions and their winning bids, one bulk write to close them, then fan out"""
+        # Stop accepting bids and give in-flight bid writes a chance to land before reading the winners
+        await asyncio.gather(*(bid_books.close(auction_id) for auction_id in auction_ids))
+        
+        auctions = await db.auctions.aggregate([
+            {"$match": {"id": {"$in": auction_ids}, "is_active": True}},
+            {"$lookup": {"from": "bids", "localField": "winning_bid_id", "foreignField": "id", "as": "winning_bids"}},
+            {"$project": {"_id": 0, "id": 1, "tournament_id": 1, "player_id": 1, "current_bid": 1,
+                          "end_time": 1, "winning_bid_id": 1, "winning_bids": 1}}
+        ]).to_list(None)
+        
+        now = datetime.utcnow()
+        found = {auction["id"] for auction in auctions}
+        for auction_id in auction_ids:
+            if auction_id not in found:
+                self._forget(auction_id)  # already ended elsewhere
+        ending = []
+        for auction in auctions:
+            if auction.get("end_time") and auction["end_time"] > now and auction["id"] in self.auction_data:
+                # Extended by another process whose timer_extend has not arrived yet
+                self._reschedule(auction["id"], auction["end_time"])
+            else:
+                ending.append(auction)
+        if not ending:
+            return
+            
+        # Highest bids from the winning-bid pointers; legacy auctions fall back to the flag
+        highest_bids = {auction["id"]: auction["winning_bids"][0] for auction in ending if auction["winning_bids"]}
+        legacy = [auction["id"] for auction in ending if not auction.get("winning_bid_id")]
+        if legacy:
+            async for bid in db.bids.find({"auction_id": {"$in": legacy}, "is_winning": True}):
+                highest_bids.setdefault(bid["auction_id"], bid)
+        # A live book's leader is authoritative; Mongo lags it while a bid write is still retrying
+        for auction in ending:
+            leading_bid = bid_books.leading_bid(auction["id"])
+            if leading_bid:
+                highest_bids[auction["id"]] = leading_bid
+                
+        results = []
+        for auction in ending:
+            highest_bid = highest_bids.get(auction["id"])
             winner_data = None
             if highest_bid:
                 winner_data = {
@@ -107,53 +442,94 @@ class AuctionTimer:
                     "username": highest_bid["username"],
                     "winning_bid": highest_bid["amount"]
                 }
+            results.append((auction, winner_data))
             
-            # Update auction status
-            await db.auctions.update_one(
-                {"id": auction_id},
+        # Close them all; only one process can flip is_active, so only one settles each auction
+        write = await db.auctions.bulk_write([
+            UpdateOne(
+                {"id": auction["id"], "is_active": True},
                 {"$set": {
                     "is_active": False,
-                    "end_time": datetime.utcnow(),
+                    "end_time": now,
                     "winner_id": winner_data["user_id"] if winner_data else None,
-                    "final_price": winner_data["winning_bid"] if winner_data else auction["current_bid"]
+                    "final_price": winner_data["winning_bid"] if winner_data else auction["current_bid"],
+                    "ended_by": self.leases.owner
                 }}
             )
+            for auction, winner_data in results
+        ], ordered=False)
+        if write.modified_count < len(results):
+            ours = {doc["id"] async for doc in db.auctions.find(
+                {"id": {"$in": [auction["id"] for auction, _ in results]}, "ended_by": self.leases.owner}, {"id": 1}
+            )}
+            for auction, _ in results:
+                if auction["id"] not in ours:
+                    self._forget(auction["id"])
+            results = [(auction, winner_data) for auction, winner_data in results if auction["id"] in ours]
+        self.stats["ended"] += len(results)
+        
+        # Charge the winners' budgets and fill their squad slots
+        try:
+            await budget_ledgers.settle_many([
+                (auction, winner_data["user_id"] if winner_data else None, winner_data["winning_bid"] if winner_data else 0)
+                for auction, winner_data in results
+            ], db)
+        except Exception as e:
+            logger.error(f"Error settling budgets for auctions {[auction['id'] for auction, _ in results]}: {e}")
             
-            # Broadcast auction end
-            await manager.broadcast_auction_status(auction_id, "ended", {
+        # Broadcast auction ends
+        for auction, winner_data in results:
+            await manager.broadcast_auction_status(auction["id"], "ended", {
                 "winner": winner_data,
                 "final_price": winner_data["winning_bid"] if winner_data else auction["current_bid"]
             })
+            self._forget(auction["id"])
+            logger.info(f"Auction {auction['id']} ended. Winner: {winner_data}")
             
-            # Clean up
-            if auction_id in self.active_timers:
-                del self.active_timers[auction_id]
-            if auction_id in self.auction_data:
-                del self.auction_data[auction_id]
-                
-            logger.info(f"Auction {auction_id} ended. Winner: {winner_data}")
-            
-        except Exception as e:
-            logger.error(f"Error ending auction {auction_id}: {e}")
-            
+        # Clean up in the other processes
+        await self._publish_control({"type": "timer_end", "auction_ids": [auction["id"] for auction, _ in results]})
+        
     def stop_auction_timer(self, auction_id: str):
         """Stop auction timer manually"""
-        if auction_id in self.active_timers:
-            self.active_timers[auction_id].cancel()
-            del self.active_timers[auction_id]
-            
-        if auction_id in self.auction_data:
-            del self.auction_data[auction_id]
+        # Its heap entry is skipped once the auction's data is gone
+        self.auction_data.pop(auction_id, None)
             
         logger.info(f"Stopped timer for auction {auction_id}")
         
     def get_time_remaining(self, auction_id: str) -> Optional[int]:
         """Get remaining time for an auction"""
         if auction_id in self.auction_data:
-            end_time = self.auction_data[auction_id]["end_time"]
-            remaining = (end_time - datetime.utcnow()).total_seconds()
+            remaining = self.auction_data[auction_id]["deadline"] - time.monotonic()
             return max(0, int(remaining))
         return None
 
+    async def stop(self):
+        """Stop the scheduler task and hand this process's shards to the others"""
+        if self._scheduler:
+            self._scheduler.cancel()
+            self._scheduler = None
+        await self.leases.stop()
+
+    def get_stats(self) -> dict:
+        wakeups = self.stats["wakeups"]
+        batches = self.stats["settlement_batches"]
+        return {
+            "scheduled_auctions": len(self.auction_data),
+            "heap_entries": len(self._heap),
+            "wakeups": wakeups,
+            "ticks": self.stats["ticks"],
+            "syncs": self.stats["syncs"],
+            "legacy_ticks": self.legacy_ticks,
+            "control_messages": self.stats["control_messages"],
+            "leases": self.leases.get_stats(),
+            "ended": self.stats["ended"],
+            "avg_lag_ms": round(self.stats["total_lag"] / wakeups * 1000, 3) if wakeups else 0.0,
+            "max_lag_ms": round(self.stats["max_lag"] * 1000, 3),
+            "settlement_batches": batches,
+            "largest_settlement_batch": self.stats["largest_batch"],
+            "avg_settlement_ms": round(self.stats["total_settle"] / batches * 1000, 3) if batches else 0.0,
+            "max_settlement_ms": round(self.stats["max_settle"] * 1000, 3)
+        }
+
 # Global auction timer instance
 auction_timer = AuctionTimer()
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""CPU cost of one auction broadcast against room size.
+
+Compares the old loop (json.dumps and an awaited send per recipient)
+with ConnectionManager.broadcast_to_auction, which encodes once and
+enqueues onto per-connection send queues. The enqueue column is how long
+the caller (a bid request or the timer loop) is held up; the delivery
+column is the CPU the connection writer tasks spend draining the
+queues afterwards. The msgpack column is the same delivery for clients
+that negotiated the MessagePack subprotocol. Sockets' sends do nothing,
+so only server-side work is measured.
+
+    python backend/benchmarks/broadcast_benchmark.py
+"""
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from websocket_manager import AuctionStream, ConnectionManager  # noqa: E402
+from wire_format import MSGPACK_SUBPROTOCOL, Frame, msgpack_available  # noqa: E402
+
+ROOM_SIZES = [10, 100, 500, 1000, 2000, 5000]
+ROUNDS = 200
+
+class NullWebSocket:
+    def __init__(self, subprotocols=()):
+        self.scope = {"subprotocols": list(subprotocols)}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+def sample_message() -> dict:
+    return {
+        "type": "bid_update",
+        "auction_id": "c0ffee00-0000-4000-8000-000000000000",
+        "bid": {
+            "id": "b1d00000-0000-4000-8000-000000000000",
+            "auction_id": "c0ffee00-0000-4000-8000-000000000000",
+            "user_id": "05e40000-0000-4000-8000-000000000000",
+            "username": "CricketKing",
+            "amount": 1250000,
+            "timestamp": datetime.utcnow().isoformat(),
+            "is_winning": True
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+async def build_manager(room_size: int, subprotocols=()) -> ConnectionManager:
+    manager = ConnectionManager()
+    # Fill the room directly; join_auction would broadcast user_joined to everyone already in it
+    room = manager.auction_connections["bench"] = set()
+    manager.streams["bench"] = AuctionStream()
+    for i in range(room_size):
+        connection = await manager.connect(NullWebSocket(subprotocols), f"user-{i}")
+        connection.auction_id = "bench"
+        room.add(connection.id)
+    return manager
+
+async def legacy_broadcast(manager: ConnectionManager, message: dict):
+    for connection_id in manager.auction_connections["bench"].copy():
+        await manager.connections[connection_id].websocket.send_text(json.dumps(message))
+
+async def measure_legacy(manager: ConnectionManager, message: dict) -> float:
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        await legacy_broadcast(manager, message)
+    return (time.process_time() - start) / ROUNDS * 1e6
+
+async def measure_pipeline(manager: ConnectionManager, message: dict):
+    enqueue = delivery = 0.0
+    for _ in range(ROUNDS):
+        start = time.process_time()
+        await manager.broadcast_to_auction("bench", message)
+        enqueue += time.process_time() - start
+
+        start = time.process_time()
+        while any(c.queue for c in manager.connections.values()):
+            await asyncio.sleep(0)
+        delivery += time.process_time() - start
+    return enqueue / ROUNDS * 1e6, delivery / ROUNDS * 1e6
+
+async def main():
+    message = sample_message()
+    frame = Frame(message)
+    if msgpack_available():
+        print(f"frame size: json {len(frame.json().encode())} bytes, msgpack {len(frame.msgpack())} bytes")
+    print(f"{'room size':>10} {'serial send us':>15} {'enqueue us':>11} {'delivery us':>12} {'msgpack us':>11}")
+    for size in ROOM_SIZES:
+        manager = await build_manager(size)
+        legacy = await measure_legacy(manager, message)
+        enqueue, delivery = await measure_pipeline(manager, message)
+        packed = float("nan")
+        if msgpack_available():
+            binary = await build_manager(size, [MSGPACK_SUBPROTOCOL])
+            _, packed = await measure_pipeline(binary, message)
+            manager.connections.update(binary.connections)
+        print(f"{size:>10} {legacy:>15.1f} {enqueue:>11.1f} {delivery:>12.1f} {packed:>11.1f}")
+        for connection in list(manager.connections.values()):
+            manager.disconnect(connection)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Event-loop cost of running the countdowns of many concurrent auctions.
+
+Compares the old design (one task per auction sleeping 1 or 5 seconds
+between ticks) with AuctionTimer's single heap-driven scheduler, first
+keeping the legacy tick cadence and then with the timer_sync protocol,
+where clients count down locally and only warnings wake an auction.
+All run the same number of auctions for the same wall-clock window and
+broadcast into an empty room, so the numbers are scheduling overhead:
+CPU time used, tasks alive, and how late wake-ups fire, counted from when
+each auction was started. The designs do not wake the same number of
+times in a window: the old loop ticks every 5 seconds from its start, the
+scheduler on the 5 second marks before the deadline, so the CPU cost is
+also given per wake-up.
+
+    python backend/benchmarks/scheduler_benchmark.py [auctions] [seconds]
+"""
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from auction_timer import AuctionTimer  # noqa: E402
+from websocket_manager import manager  # noqa: E402
+
+AUCTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+WINDOW_SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 6
+
+def durations():
+    # Long enough that no auction ends inside the window
+    rng = random.Random(7)
+    return [rng.randint(60, 600) for _ in range(AUCTIONS)]
+
+async def legacy_timer(auction_id: str, duration_seconds: int, lags: list, started: float):
+    remaining = duration_seconds
+    # Lag counts from when the auction was started, as the scheduler's does
+    expected = started
+    while remaining > 0:
+        lags.append(time.monotonic() - expected)
+        broadcast_interval = 1 if remaining <= 10 else 5
+        await manager.broadcast_to_auction(auction_id, {
+            "type": "timer_update",
+            "auction_id": auction_id,
+            "time_remaining": remaining,
+            "total_duration": duration_seconds
+        })
+        await asyncio.sleep(broadcast_interval)
+        expected += broadcast_interval
+        remaining -= broadcast_interval
+
+async def run_legacy():
+    lags = []
+    start_cpu = time.process_time()
+    tasks = [asyncio.create_task(legacy_timer(f"auction-{i}", d, lags, time.monotonic()))
+             for i, d in enumerate(durations())]
+    await asyncio.sleep(WINDOW_SECONDS)
+    cpu = time.process_time() - start_cpu
+    alive = len(asyncio.all_tasks())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return cpu, alive, lags
+
+async def run_scheduler(legacy_ticks: bool):
+    timer = AuctionTimer(legacy_ticks=legacy_ticks)
+    start_cpu = time.process_time()
+    for i, d in enumerate(durations()):
+        await timer.start_auction_timer(f"auction-{i}", d, None)
+    await asyncio.sleep(WINDOW_SECONDS)
+    cpu = time.process_time() - start_cpu
+    alive = len(asyncio.all_tasks())
+    stats = timer.get_stats()
+    await timer.stop()
+    return cpu, alive, stats
+
+def describe(name: str, cpu: float, alive: int, wakeups: int, avg_lag_ms: float, max_lag_ms: float):
+    per_wakeup = f"{cpu / wakeups * 1e6:.1f}" if wakeups else "-"
+    print(f"{name:>10} {cpu:>8.2f} {cpu / WINDOW_SECONDS * 100:>7.1f}% {alive:>7} {wakeups:>9} {per_wakeup:>10} "
+          f"{avg_lag_ms:>12.2f} {max_lag_ms:>12.2f}")
+
+async def main():
+    print(f"{AUCTIONS} auctions for {WINDOW_SECONDS:g}s")
+    print(f"{'design':>10} {'cpu s':>8} {'of core':>8} {'tasks':>7} {'wake-ups':>9} {'us/wake':>10} "
+          f"{'avg lag ms':>12} {'max lag ms':>12}")
+    cpu, alive, lags = await run_legacy()
+    describe("per-task", cpu, alive, len(lags), statistics.mean(lags) * 1000, max(lags) * 1000)
+    cpu, alive, stats = await run_scheduler(legacy_ticks=True)
+    describe("scheduler", cpu, alive, stats["wakeups"], stats["avg_lag_ms"], stats["max_lag_ms"])
+    cpu, alive, stats = await run_scheduler(legacy_ticks=False)
+    describe("sync", cpu, alive, stats["wakeups"], stats["avg_lag_ms"], stats["max_lag_ms"])
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Set, Tuple
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Number of recent bids kept in memory per live auction
+BID_BOOK_HISTORY = int(os.environ.get('BID_BOOK_HISTORY', '50'))
+
+# Background bid writes that fail are retried with backoff up to this many seconds apart until they land
+BID_WRITE_RETRY_MAX_SECONDS = float(os.environ.get('BID_WRITE_RETRY_MAX_SECONDS', '30'))
+# How long settlement waits for an auction's pending bid writes before using the book's leader anyway
+BID_CLOSE_WAIT_SECONDS = float(os.environ.get('BID_CLOSE_WAIT_SECONDS', '5'))
+
+# "book" validates against the in-process bid book (single worker),
+# "atomic" validates and applies each bid with one conditional Mongo write (any number of workers)
+BID_ACCEPTANCE_MODE = os.environ.get('BID_ACCEPTANCE_MODE', 'book')
+
+class BidRejected(Exception):
+    """Raised when a bid fails validation against the bid book"""
+    def __init__(self, reason: str, status_code: int = 400):
+        super().__init__(reason)
+        self.status_code = status_code
+
+def bid_document(bid: dict) -> dict:
+    """Stored form of a bid; "winning" is derived from the auction's pointer, not stored"""
+    doc = dict(bid)
+    doc.pop("is_winning", None)
+    return doc
+
+def leading_bid_fields(bid: dict) -> dict:
+    """Auction fields that make a bid the current leader"""
+    return {
+        "current_bid": bid["amount"],
+        "highest_bidder_id": bid["user_id"],
+        "winning_bid_id": bid["id"],
+        "winning_bid_amount": bid["amount"]
+    }
+
+class BidBook:
+    """Authoritative in-memory state of a single live auction"""
+
+    def __init__(self, auction: dict, history: int = BID_BOOK_HISTORY):
+        self.auction_id: str = auction["id"]
+        self.current_bid: int = auction["current_bid"]
+        self.highest_bidder_id: Optional[str] = auction.get("highest_bidder_id")
+        self.winning_bid_id: Optional[str] = auction.get("winning_bid_id")
+        self.min_increment: int = auction.get("min_increment", 25000)
+        self.end_time: Optional[datetime] = auction.get("end_time")
+        self.is_active: bool = auction.get("is_active", True)
+        self.recent_bids: Deque[dict] = deque(maxlen=history)
+
+    @property
+    def min_bid(self) -> int:
+        return self.current_bid + self.min_increment
+
+    def validate(self, amount: int, now: Optional[datetime] = None):
+        """Check a bid amount against the current book state"""
+        if not self.is_active:
+            raise BidRejected("Auction is not active")
+
+        now = now or datetime.utcnow()
+        if self.end_time and now > self.end_time:
+            raise BidRejected("Auction has ended")
+
+        if amount < self.min_bid:
+            raise BidRejected(f"Minimum bid is ${self.min_bid}")
+
+    def accept(self, bid: dict):
+        """Validate and apply a bid; raises BidRejected if it does not beat the book"""
+        self.validate(bid["amount"], bid.get("timestamp"))
+        self.current_bid = bid["amount"]
+        self.highest_bidder_id = bid["user_id"]
+        self.winning_bid_id = bid["id"]
+        self.recent_bids.appendleft(bid)
+
+    def leader(self) -> Tuple[int, Optional[str], Optional[str]]:
+        return self.current_bid, self.highest_bidder_id, self.winning_bid_id
+
+    def leading_bid(self) -> Optional[dict]:
+        """The bid the book currently shows as winning, if it is still in recent_bids"""
+        if not self.winning_bid_id:
+            return None
+        return next((bid for bid in self.recent_bids if bid["id"] == self.winning_bid_id), None)
+
+    def revert(self, bid: dict, previous: Tuple[int, Optional[str], Optional[str]]):
+        """Undo accept() for a bid that could not be made durable"""
+        try:
+            self.recent_bids.remove(bid)
+        except ValueError:
+            pass
+        if self.winning_bid_id != bid["id"]:
+            return  # already outbid, so the book no longer shows it
+        # Fall back to the newest bid still in the book; it may itself be reverted later
+        if self.recent_bids:
+            newest = self.recent_bids[0]
+            previous = (newest["amount"], newest["user_id"], newest["id"])
+        self.current_bid, self.highest_bidder_id, self.winning_bid_id = previous
+
+class BidBookManager:
+    def __init__(self, mode: str = BID_ACCEPTANCE_MODE):
+        self.mode = mode
+        self.books: Dict[str, BidBook] = {}
+        self._seed_locks: Dict[str, asyncio.Lock] = {}
+        self._pending_writes: Dict[str, Set[asyncio.Task]] = {}
+        self.journal = None  # set to a running BidJournal for write-behind durability
+
+    def create(self, auction: dict) -> Optional[BidBook]:
+        """Register a book for a freshly created auction"""
+        if self.mode == "atomic":
+            return None
+        book = BidBook(auction)
+        self.books[book.auction_id] = book
+        return book
+
+    async def get(self, auction_id: str, db) -> Optional[BidBook]:
+        """Get the book for an auction, seeding it from Mongo on first access"""
+        book = self.books.get(auction_id)
+        if book:
+            return book
+
+        lock = self._seed_locks.setdefault(auction_id, asyncio.Lock())
+        async with lock:
+            book = self.books.get(auction_id)
+            if book:
+                return book
+
+            auction = await db.auctions.find_one({"id": auction_id})
+            if not auction:
+                self._seed_locks.pop(auction_id, None)
+                return None
+
+            book = BidBook(auction)
+            recent = await db.bids.find({"auction_id": auction_id}).sort("timestamp", -1).to_list(book.recent_bids.maxlen)
+            book.recent_bids.extend(recent)
+
+            # Only live auctions are kept resident; ended ones are answered once and dropped
+            if book.is_active:
+                self.books[auction_id] = book
+            self._seed_locks.pop(auction_id, None)
+
+            logger.info(f"Seeded bid book for auction {auction_id} from database")
+            return book
+
+    async def snapshot(self, auction_id: str, db) -> Optional[dict]:
+        """Current bidding state of an auction from the book, or Mongo in atomic mode"""
+        if self.mode == "atomic":
+            return await db.auctions.find_one({"id": auction_id})
+
+        book = await self.get(auction_id, db)
+        return self._state(book) if book else None
+
+    def _state(self, book: BidBook) -> dict:
+        return {
+            "id": book.auction_id,
+            "current_bid": book.current_bid,
+            "highest_bidder_id": book.highest_bidder_id,
+            "winning_bid_id": book.winning_bid_id,
+            "min_increment": book.min_increment,
+            "end_time": book.end_time,
+            "is_active": book.is_active
+        }
+
+    async def accept(self, auction_id: str, bid: dict, db) -> dict:
+        """Accept a bid using the configured mode and return the resulting auction state"""
+        if self.mode == "atomic":
+            return await self.accept_atomic(auction_id, bid, db)
+
+        book = await self.get(auction_id, db)
+        if not book:
+            raise BidRejected("Auction not found", status_code=404)
+
+        previous = book.leader()
+        book.accept(bid)
+        if self.journal:
+            try:
+                await self.journal.append(auction_id, bid)
+            except Exception as e:
+                # Never acknowledged, written or broadcast, so later bids must not be checked against it
+                book.revert(bid, previous)
+                logger.error(f"Could not journal bid {bid['id']} on auction {auction_id}: {e}")
+                raise BidRejected("Bid could not be recorded, please try again", status_code=503)
+        else:
+            self.persist(auction_id, bid, db)
+        return self._state(book)
+
+    async def accept_atomic(self, auction_id: str, bid: dict, db) -> dict:
+        """Check and apply a bid in a single conditional find_one_and_update"""
+        amount = bid["amount"]
+        now = bid.get("timestamp") or datetime.utcnow()
+        auction = await db.auctions.find_one_and_update(
+            {
+                "id": auction_id,
+                "is_active": True,
+                "$or": [{"end_time": None}, {"end_time": {"$gte": now}}],
+                "$expr": {"$lte": [{"$add": ["$current_bid", "$min_increment"]}, amount]}
+            },
+            {"$set": leading_bid_fields(bid)},
+            return_document=ReturnDocument.AFTER
+        )
+        if not auction:
+            raise await self._rejection_reason(auction_id, now, db)
+
+        await db.bids.insert_one(bid_document(bid))
+        return auction
+
+    async def _rejection_reason(self, auction_id: str, now: datetime, db) -> BidRejected:
+        # Only reached when the conditional write matched nothing, so the
+        # extra read is off the happy path
+        auction = await db.auctions.find_one({"id": auction_id})
+        if not auction:
+            return BidRejected("Auction not found", status_code=404)
+        if not auction.get("is_active", True):
+            return BidRejected("Auction is not active")
+        if auction.get("end_time") and now > auction["end_time"]:
+            return BidRejected("Auction has ended")
+        min_bid = auction["current_bid"] + auction.get("min_increment", 25000)
+        return BidRejected(f"Minimum bid is ${min_bid}")
+
+    def extend(self, auction_id: str, end_time: datetime):
+        """Move a book's deadline after a timer extension"""
+        book = self.books.get(auction_id)
+        if book and (book.end_time is None or end_time > book.end_time):
+            book.end_time = end_time
+
+    def persist(self, auction_id: str, bid: dict, db):
+        """Write an accepted bid to Mongo in the background"""
+        task = asyncio.create_task(self._persist_bid(auction_id, bid, db))
+        pending = self._pending_writes.setdefault(auction_id, set())
+        pending.add(task)
+        task.add_done_callback(lambda t: self._write_done(auction_id, t))
+
+    def _write_done(self, auction_id: str, task: asyncio.Task):
+        pending = self._pending_writes.get(auction_id)
+        if pending is not None:
+            pending.discard(task)
+            if not pending:
+                del self._pending_writes[auction_id]
+
+    async def _persist_bid(self, auction_id: str, bid: dict, db):
+        # Every write is conditional on the bid amount so background writes
+        # can land in any order and still converge on the highest bid.
+        # The bid was already acknowledged and broadcast, so a failed write is
+        # retried until it lands; upserting on the bid id makes retries idempotent
+        delay = 0.1
+        while True:
+            try:
+                await db.bids.update_one({"id": bid["id"]}, {"$setOnInsert": bid_document(bid)}, upsert=True)
+                await db.auctions.update_one(
+                    {"id": auction_id, "current_bid": {"$lt": bid["amount"]}},
+                    {"$set": leading_bid_fields(bid)}
+                )
+                return
+            except Exception as e:
+                logger.error(f"Error persisting bid {bid['id']} for auction {auction_id}, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, BID_WRITE_RETRY_MAX_SECONDS)
+
+    async def close(self, auction_id: str, timeout: float = BID_CLOSE_WAIT_SECONDS):
+        """Stop accepting bids for an auction and give its pending writes up to `timeout` to land"""
+        book = self.books.get(auction_id)
+        if book:
+            book.is_active = False
+
+        waits = list(self._pending_writes.get(auction_id, ()))
+        if self.journal:
+            waits.append(asyncio.ensure_future(self.journal.drain(auction_id)))
+        if waits:
+            # asyncio.wait leaves unfinished writes running; they keep retrying after settlement
+            _, pending = await asyncio.wait(waits, timeout=timeout)
+            if pending:
+                logger.warning(f"Bid writes for auction {auction_id} still pending at close; settling from the book")
+
+    def leading_bid(self, auction_id: str) -> Optional[dict]:
+        """Winning bid of a resident book, which may be ahead of Mongo while its write is pending"""
+        book = self.books.get(auction_id)
+        return book.leading_bid() if book else None
+
+    def remove(self, auction_id: str):
+        """Tear down the book of an ended auction"""
+        self.books.pop(auction_id, None)
+        self._seed_locks.pop(auction_id, None)
+
+    def get_winning_bid_id(self, auction_id: str) -> Optional[str]:
+        """Winning bid pointer of a resident book, if any"""
+        book = self.books.get(auction_id)
+        return book.winning_bid_id if book else None
+
+    def get_active_books_count(self) -> int:
+        """Get number of auctions with a resident bid book"""
+        return len(self.books)
+
+# Global bid book manager instance
+bid_books = BidBookManager()
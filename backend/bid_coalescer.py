@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from bid_book import BidRejected
+
+logger = logging.getLogger(__name__)
+
+# Coalescing window per auction; 0 disables coalescing
+BID_COALESCE_WINDOW_MS = float(os.environ.get('BID_COALESCE_WINDOW_MS', '0'))
+# Coalescing only kicks in once an auction is this close to its deadline
+BID_COALESCE_FINAL_SECONDS = int(os.environ.get('BID_COALESCE_FINAL_SECONDS', '30'))
+
+class BidCoalescer:
+    """Collects bids for an auction over a few milliseconds and accepts only the best one"""
+
+    def __init__(self, window_ms: float = BID_COALESCE_WINDOW_MS, final_seconds: int = BID_COALESCE_FINAL_SECONDS):
+        self.window = window_ms / 1000
+        self.final_seconds = final_seconds
+        self.windows: Dict[str, List[Tuple[dict, asyncio.Future]]] = {}
+        self._tasks = set()
+        self.stats = {"windows": 0, "bids": 0, "superseded": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def applies(self, time_remaining) -> bool:
+        """Whether bids for an auction with this much time left should be coalesced"""
+        return self.enabled and time_remaining is not None and time_remaining <= self.final_seconds
+
+    async def submit(self, auction_id: str, bid: dict, accept: Callable[[dict], Awaitable[dict]]) -> dict:
+        """Queue a bid in the auction's current window.
+
+        Returns the accepted auction state if this bid wins the window,
+        raises BidRejected if another bid in the same window beat it.
+        """
+        batch = self.windows.get(auction_id)
+        if batch is None:
+            batch = self.windows[auction_id] = []
+            task = asyncio.create_task(self._close_window(auction_id, accept))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        future = asyncio.get_running_loop().create_future()
+        batch.append((bid, future))
+        self.stats["bids"] += 1
+        return await future
+
+    async def _close_window(self, auction_id: str, accept: Callable[[dict], Awaitable[dict]]):
+        await asyncio.sleep(self.window)
+        batch = self.windows.pop(auction_id, [])
+        self.stats["windows"] += 1
+
+        # Highest amount first, earliest first among equal amounts
+        batch.sort(key=lambda entry: (-entry[0]["amount"], entry[0]["timestamp"]))
+        state = None
+        for bid, future in batch:
+            if future.done():
+                continue  # the submitting request went away
+            if state is not None:
+                min_bid = state["current_bid"] + state.get("min_increment", 25000)
+                self.stats["superseded"] += 1
+                future.set_exception(BidRejected(f"Outbid; minimum bid is ${min_bid}"))
+                continue
+            try:
+                state = await accept(bid)
+            except Exception as e:
+                # Rejections specific to this bidder must not sink the rest of the window
+                future.set_exception(e)
+                continue
+            future.set_result(state)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "open_windows": len(self.windows), "window_ms": self.window * 1000}
+
+# Global bid coalescer instance
+bid_coalescer = BidCoalescer()
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from bid_book import bid_books, bid_document, leading_bid_fields
+
+logger = logging.getLogger(__name__)
+
+# "async" writes accepted bids straight to Mongo in the background,
+# "journal" acknowledges once the bid is fsynced to the local journal and drains it to Mongo later
+BID_DURABILITY_MODE = os.environ.get('BID_DURABILITY_MODE', 'async')
+BID_JOURNAL_DIR = os.environ.get('BID_JOURNAL_DIR', str(Path(__file__).parent / 'bid_journal'))
+BID_JOURNAL_COMMIT_MS = float(os.environ.get('BID_JOURNAL_COMMIT_MS', '5'))
+BID_JOURNAL_SEGMENT_BYTES = int(os.environ.get('BID_JOURNAL_SEGMENT_BYTES', str(4 * 1024 * 1024)))
+BID_JOURNAL_BATCH_SIZE = int(os.environ.get('BID_JOURNAL_BATCH_SIZE', '500'))
+
+def _encode_record(auction_id: str, bid: dict) -> bytes:
+    bid = dict(bid)
+    bid.pop("_id", None)
+    if isinstance(bid.get("timestamp"), datetime):
+        bid["timestamp"] = bid["timestamp"].isoformat()
+    return (json.dumps({"auction_id": auction_id, "bid": bid}) + "\n").encode("utf-8")
+
+def _decode_record(line: bytes) -> dict:
+    record = json.loads(line)
+    bid = record["bid"]
+    if isinstance(bid.get("timestamp"), str):
+        bid["timestamp"] = datetime.fromisoformat(bid["timestamp"])
+    return record
+
+class BidJournal:
+    """Append-only, group-committed segment journal for accepted bids"""
+
+    def __init__(self, directory: str = BID_JOURNAL_DIR, commit_interval_ms: float = BID_JOURNAL_COMMIT_MS,
+                 segment_bytes: int = BID_JOURNAL_SEGMENT_BYTES, batch_size: int = BID_JOURNAL_BATCH_SIZE):
+        self.directory = Path(directory)
+        self.commit_interval = commit_interval_ms / 1000
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+
+        self._db = None
+        self._file = None
+        self._segment_id = 0
+        self._segment_size = 0
+        self._segment_pending: Dict[int, int] = {}  # segment id -> records not yet in Mongo
+        self._buffer: List[Tuple[bytes, str, dict, asyncio.Future]] = []
+        self._committed: Deque[Tuple[int, str, dict]] = deque()
+        self._auction_pending: Dict[str, int] = {}
+        self._drain_waiters: Dict[str, List[asyncio.Future]] = {}
+        self._commit_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_wakeup = asyncio.Event()
+
+        self.stats = {"appended": 0, "commits": 0, "flushed": 0, "flush_errors": 0, "replayed": 0}
+
+    @property
+    def is_running(self) -> bool:
+        return self._commit_task is not None
+
+    async def start(self, db):
+        """Replay unflushed segments left by a previous process, then start committing"""
+        self._db = db
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        segments = self._segment_paths()
+        if segments:
+            await self._replay(segments)
+        self._segment_id = self._segment_number(segments[-1]) + 1 if segments else 1
+        await self._run_io(self._open_segment)
+
+        self._commit_task = asyncio.create_task(self._commit_loop())
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Bid journal started in {self.directory}")
+
+    async def stop(self):
+        """Commit buffered bids and drain what Mongo will take before shutting down"""
+        if not self.is_running:
+            return
+        # Bids accepted from here on are written straight to Mongo instead of waiting on a stopped commit loop
+        if bid_books.journal is self:
+            bid_books.journal = None
+        self._commit_task.cancel()
+        await asyncio.gather(self._commit_task, return_exceptions=True)
+        self._commit_task = None
+        await self._commit()
+
+        self._flush_task.cancel()
+        await asyncio.gather(self._flush_task, return_exceptions=True)
+        self._flush_task = None
+        try:
+            await self._flush_committed()
+        except Exception as e:
+            logger.error(f"Bid journal left unflushed records for replay: {e}")
+
+        await self._run_io(self._close_segment)
+        if not self._committed:
+            await self._run_io(self._segment_path(self._segment_id).unlink, True)
+
+    async def append(self, auction_id: str, bid: dict):
+        """Append an accepted bid; returns once the group commit holding it is fsynced"""
+        if not self.is_running:
+            raise RuntimeError("Bid journal is stopped")
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((_encode_record(auction_id, bid), auction_id, bid, future))
+        self._auction_pending[auction_id] = self._auction_pending.get(auction_id, 0) + 1
+        self.stats["appended"] += 1
+        await future
+
+    async def drain(self, auction_id: str):
+        """Wait until every journaled bid of an auction has reached Mongo"""
+        if not self._auction_pending.get(auction_id):
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._drain_waiters.setdefault(auction_id, []).append(future)
+        self._flush_wakeup.set()
+        await future
+
+    def get_stats(self) -> dict:
+        """Journal counters and backlog"""
+        return {
+            **self.stats,
+            "buffered": len(self._buffer),
+            "unflushed": len(self._committed),
+            "segments": len(self._segment_pending) + 1
+        }
+
+    # Group commit
+
+    async def _commit_loop(self):
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            try:
+                await self._commit()
+            except Exception as e:
+                logger.error(f"Bid journal commit failed: {e}")
+
+    async def _commit(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        data = b"".join(entry[0] for entry in batch)
+
+        try:
+            segment_id = await self._run_io(self._write_and_sync, data)
+        except Exception as e:
+            for _, auction_id, _, future in batch:
+                self._release(auction_id)
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+        self.stats["commits"] += 1
+        self._segment_pending[segment_id] = self._segment_pending.get(segment_id, 0) + len(batch)
+        for _, auction_id, bid, future in batch:
+            self._committed.append((segment_id, auction_id, bid))
+            if not future.done():
+                future.set_result(None)
+        self._flush_wakeup.set()
+
+    # Background flusher
+
+    async def _flush_loop(self):
+        while True:
+            await self._flush_wakeup.wait()
+            self._flush_wakeup.clear()
+            try:
+                await self._flush_committed()
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Bid journal flush failed, retrying: {e}")
+                await asyncio.sleep(1)
+                self._flush_wakeup.set()
+
+    async def _flush_committed(self):
+        while self._committed:
+            batch = [self._committed[i] for i in range(min(self.batch_size, len(self._committed)))]
+            await self._apply([(auction_id, bid) for _, auction_id, bid in batch])
+
+            for _ in batch:
+                self._committed.popleft()
+            for segment_id, auction_id, _ in batch:
+                self._segment_pending[segment_id] -= 1
+                self._release(auction_id)
+            self.stats["flushed"] += len(batch)
+            await self._delete_flushed_segments()
+
+    async def _apply(self, records: List[Tuple[str, dict]]):
+        # Upserting on the bid id makes replays idempotent; only the highest
+        # bid per auction needs to move the auction document
+        bid_ops = []
+        leaders: Dict[str, dict] = {}
+        for auction_id, bid in records:
+            bid_ops.append(UpdateOne({"id": bid["id"]}, {"$setOnInsert": bid_document(bid)}, upsert=True))
+            if auction_id not in leaders or bid["amount"] > leaders[auction_id]["amount"]:
+                leaders[auction_id] = bid
+
+        await self._db.bids.bulk_write(bid_ops, ordered=True)
+        await self._db.auctions.bulk_write([
+            UpdateOne(
+                {"id": auction_id, "current_bid": {"$lt": bid["amount"]}},
+                {"$set": leading_bid_fields(bid)}
+            )
+            for auction_id, bid in leaders.items()
+        ], ordered=True)
+
+    def _release(self, auction_id: str):
+        remaining = self._auction_pending.get(auction_id, 0) - 1
+        if remaining > 0:
+            self._auction_pending[auction_id] = remaining
+            return
+        self._auction_pending.pop(auction_id, None)
+        for future in self._drain_waiters.pop(auction_id, []):
+            if not future.done():
+                future.set_result(None)
+
+    async def _delete_flushed_segments(self):
+        for segment_id in [s for s, count in self._segment_pending.items() if count <= 0 and s != self._segment_id]:
+            del self._segment_pending[segment_id]
+            await self._run_io(self._segment_path(segment_id).unlink, True)
+
+    # Replay
+
+    async def _replay(self, segments: List[Path]):
+        records = []
+        for path in segments:
+            records.extend(await self._run_io(self._read_segment, path))
+
+        for i in range(0, len(records), self.batch_size):
+            batch = records[i:i + self.batch_size]
+            await self._apply([(record["auction_id"], record["bid"]) for record in batch])
+
+        for path in segments:
+            await self._run_io(path.unlink, True)
+        self.stats["replayed"] += len(records)
+        logger.info(f"Replayed {len(records)} journaled bids from {len(segments)} segment(s)")
+
+    def _read_segment(self, path: Path) -> List[dict]:
+        records = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(_decode_record(line))
+                except (ValueError, KeyError):
+                    # A torn tail from a crash mid-write was never acknowledged
+                    logger.warning(f"Skipping incomplete journal record in {path.name}")
+        return records
+
+    # File handling (runs in the default executor)
+
+    async def _run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _segment_path(self, segment_id: int) -> Path:
+        return self.directory / f"segment-{segment_id:012d}.log"
+
+    def _segment_paths(self) -> List[Path]:
+        return sorted(self.directory.glob("segment-*.log"))
+
+    def _segment_number(self, path: Path) -> int:
+        return int(path.stem.split("-")[1])
+
+    def _open_segment(self):
+        self._file = open(self._segment_path(self._segment_id), "ab")
+        self._segment_size = 0
+
+    def _close_segment(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write_and_sync(self, data: bytes) -> int:
+        try:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception:
+            # The batch is answered with a 503, so none of its bytes may stay behind:
+            # replay would turn them into phantom bids, and a torn line would swallow the next record
+            self._discard_failed_write()
+            raise
+        segment_id = self._segment_id
+        self._segment_size += len(data)
+
+        if self._segment_size >= self.segment_bytes:
+            self._close_segment()
+            self._segment_id += 1
+            self._open_segment()
+        return segment_id
+
+    def _discard_failed_write(self):
+        path = self._segment_path(self._segment_id)
+        try:
+            self._file.close()
+        except OSError:
+            pass  # closing retries the failed flush; whatever it writes is cut off below
+        try:
+            with open(path, "r+b") as f:
+                f.truncate(self._segment_size)
+                f.flush()
+                os.fsync(f.fileno())
+            self._file = open(path, "ab")
+        except OSError as e:
+            # Leave the damaged segment to replay, which skips a torn tail, and write on in a fresh one
+            logger.error(f"Could not truncate {path.name} after a failed write, rotating: {e}")
+            self._segment_id += 1
+            self._open_segment()
+
+# Global bid journal instance
+bid_journal = BidJournal()
@@ -0,0 +1,241 @@
+import asyncio
+import itertools
+import logging
+import os
+import uuid
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from wire_format import Frame
+
+logger = logging.getLogger(__name__)
+
+# "local" keeps fan-out inside this process, "redis" shares it between workers
+BROADCAST_BUS = os.environ.get('BROADCAST_BUS', 'local')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+BROADCAST_CHANNEL_PREFIX = os.environ.get('BROADCAST_CHANNEL_PREFIX', 'sportx')
+# Shared counts nobody has reported for this long are dropped, e.g. those of a worker that died
+BUS_COUNT_TTL_SECONDS = int(os.environ.get('BUS_COUNT_TTL_SECONDS', '3600'))
+
+# (channel, frame, droppable) -> None, called for every message this worker should deliver
+BusHandler = Callable[[str, Frame, bool], None]
+
+def auction_channel(auction_id: str) -> str:
+    return f"auction:{auction_id}"
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+# Control messages between the workers' auction timers
+TIMER_CHANNEL = "timers"
+
+class InProcessBus:
+    """Delivers published frames straight back to this process; for one worker and tests"""
+
+    def __init__(self):
+        self.handler: Optional[BusHandler] = None
+        self.routes: Dict[str, BusHandler] = {}
+        self.stats = {"published": 0, "received": 0}
+        self._versions = itertools.count(1)
+
+    def attach(self, handler: BusHandler):
+        self.handler = handler
+
+    def route(self, channel: str, handler: BusHandler):
+        """Hand one channel's messages to its own handler instead of the attached one"""
+        self.routes[channel] = handler
+
+    def subscribe(self, channel: str):
+        pass
+
+    def unsubscribe(self, channel: str):
+        pass
+
+    async def publish(self, channel: str, frame: Frame, droppable: bool = False):
+        self.stats["published"] += 1
+        handler = self.routes.get(channel, self.handler)
+        if handler:
+            handler(channel, frame, droppable)
+
+    async def report_count(self, name: str, count: int) -> Tuple[int, int]:
+        """Record this worker's count under name; returns the total over all workers and its version"""
+        return count, next(self._versions)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_stats(self) -> dict:
+        return {"transport": "local", **self.stats}
+
+class RedisBus:
+    """Redis pub/sub fan-out between workers.
+
+    A worker only subscribes to the channels it has local sockets for.
+    Frames published here are delivered locally right away and skipped
+    when Redis echoes them back, so the publishing worker pays no round trip.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = BROADCAST_CHANNEL_PREFIX):
+        self.url = url
+        self.prefix = prefix + ":"
+        self.origin = uuid.uuid4().hex
+        self.handler: Optional[BusHandler] = None
+        self.routes: Dict[str, BusHandler] = {}
+        self.channels: Set[str] = set()
+        self._subscribed: Set[str] = set()
+        self._changed = asyncio.Event()
+        self._redis = None
+        self._reader: Optional[asyncio.Task] = None
+        self._counted: Set[str] = set()
+        self.stats = {"published": 0, "received": 0, "publish_errors": 0, "reconnects": 0}
+
+    def attach(self, handler: BusHandler):
+        self.handler = handler
+
+    def route(self, channel: str, handler: BusHandler):
+        """Hand one channel's messages to its own handler instead of the attached one"""
+        self.routes[channel] = handler
+        self.subscribe(channel)
+
+    def subscribe(self, channel: str):
+        self.channels.add(channel)
+        self._changed.set()
+
+    def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+        self._changed.set()
+
+    async def publish(self, channel: str, frame: Frame, droppable: bool = False):
+        self.stats["published"] += 1
+        handler = self.routes.get(channel, self.handler)
+        if handler:
+            handler(channel, frame, droppable)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.publish(self.prefix + channel, f"{self.origin} {int(droppable)}\n{frame.json()}")
+        except Exception as e:
+            self.stats["publish_errors"] += 1
+            logger.error(f"Error publishing to {channel}: {e}")
+
+    async def report_count(self, name: str, count: int) -> Tuple[int, int]:
+        """Record this worker's count under name; returns the total over all workers and its version.
+
+        Each worker owns one field of a hash per name. The total is read in the
+        same transaction that bumps the version, so a higher version always
+        carries the newer total, whichever worker's frame arrives first.
+        """
+        if self._redis is None:
+            return count, 0
+        key = f"{self.prefix}counts:{name}"
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                if count:
+                    pipe.hset(key, self.origin, count)
+                else:
+                    pipe.hdel(key, self.origin)
+                pipe.expire(key, BUS_COUNT_TTL_SECONDS)
+                pipe.hvals(key)
+                pipe.incr(key + ":version")
+                pipe.expire(key + ":version", BUS_COUNT_TTL_SECONDS)
+                results = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error reporting count {name}: {e}")
+            return count, 0
+        if count:
+            self._counted.add(key)
+        else:
+            self._counted.discard(key)
+        return sum(int(value) for value in results[2]), results[3]
+
+    async def start(self):
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(self.url, decode_responses=True)
+        self._reader = asyncio.create_task(self._read_loop())
+        logger.info(f"Broadcast bus connected to {self.url}")
+
+    async def stop(self):
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._redis is not None:
+            # Take this worker's share out of the shared counts
+            for key in self._counted:
+                try:
+                    await self._redis.hdel(key, self.origin)
+                except Exception as e:
+                    logger.error(f"Error clearing count {key}: {e}")
+            self._counted.clear()
+            await self._redis.close()
+            self._redis = None
+
+    async def _read_loop(self):
+        # One task owns the pub/sub connection: it applies subscription changes
+        # between reads, so subscribe/unsubscribe never race a pending read
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            self._subscribed = set()
+            self._changed.set()
+            try:
+                while True:
+                    await self._sync_subscriptions(pubsub)
+                    if not self._subscribed:
+                        await self._changed.wait()
+                        continue
+                    message = await pubsub.get_message(timeout=0.05)
+                    if message and message["type"] == "message":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                self.stats["reconnects"] += 1
+                logger.error(f"Broadcast bus connection lost, resubscribing: {e}")
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+                await asyncio.sleep(1)
+
+    async def _sync_subscriptions(self, pubsub):
+        if not self._changed.is_set():
+            return
+        self._changed.clear()
+        added = self.channels - self._subscribed
+        removed = self._subscribed - self.channels
+        if added:
+            await pubsub.subscribe(*(self.prefix + channel for channel in added))
+        if removed:
+            await pubsub.unsubscribe(*(self.prefix + channel for channel in removed))
+        self._subscribed = (self._subscribed | added) - removed
+
+    def _dispatch(self, channel: str, data: str):
+        header, _, frame = data.partition("\n")
+        origin, _, droppable = header.partition(" ")
+        if origin == self.origin:
+            return  # already delivered locally when it was published
+        self.stats["received"] += 1
+        channel = channel[len(self.prefix):]
+        handler = self.routes.get(channel, self.handler)
+        if handler:
+            handler(channel, Frame.from_json(frame), droppable == "1")
+
+    def get_stats(self) -> dict:
+        return {"transport": "redis", "channels": len(self.channels), **self.stats}
+
+def create_bus(kind: str = BROADCAST_BUS):
+    if kind == "redis":
+        return RedisBus()
+    if kind != "local":
+        logger.warning(f"Unknown BROADCAST_BUS {kind!r}, using the in-process bus")
+    return InProcessBus()
+
+# Global broadcast bus instance
+broadcast_bus = create_bus()
@@ -0,0 +1,485 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from bid_book import BidRejected, bid_books
+from timer_lease import timer_leases
+
+logger = logging.getLogger(__name__)
+
+# PlayerPosition value -> SquadComposition field
+POSITION_SLOTS = {
+    "Batsman": "batsmen",
+    "Bowler": "bowlers",
+    "All Rounder": "all_rounders",
+    "Wicket Keeper": "wicket_keepers"
+}
+
+def _position(player: Optional[dict]) -> Optional[str]:
+    if not player:
+        return None
+    position = player.get("position")
+    return getattr(position, "value", position)
+
+class ParticipantAccount:
+    __slots__ = ("user_id", "current_budget", "reserved", "squad_counts", "leading_counts")
+
+    def __init__(self, user_id: str, current_budget: int):
+        self.user_id = user_id
+        self.current_budget = current_budget  # funds not yet spent on won players, as stored in Mongo
+        self.reserved = 0  # held by leading and in-flight bids
+        self.squad_counts: Dict[str, int] = {}
+        self.leading_counts: Dict[str, int] = {}
+
+    @property
+    def available(self) -> int:
+        return self.current_budget - self.reserved
+
+class Hold:
+    """Funds set aside for a bid between validation and acceptance"""
+    __slots__ = ("ledger", "auction_id", "user_id", "amount", "position", "basis")
+
+    def __init__(self, ledger, auction_id: str, user_id: str, amount: int, position: str, basis: int = 0):
+        self.ledger = ledger
+        self.auction_id = auction_id
+        self.user_id = user_id
+        self.amount = amount
+        self.position = position
+        self.basis = basis  # the bidder's own leading reservation on the auction, reused rather than reserved again
+
+class TournamentLedger:
+    """Available and reserved budget plus squad slots of every participant of a tournament"""
+
+    def __init__(self, tournament_id: str, squad_limits: Dict[str, int]):
+        self.tournament_id = tournament_id
+        self.squad_limits = squad_limits
+        self.accounts: Dict[str, ParticipantAccount] = {}
+        self.reservations: Dict[str, Tuple[str, int, str]] = {}  # auction_id -> (user_id, amount, position)
+        self.settled: Set[str] = set()
+
+    def add_participant(self, participant: dict, positions: Dict[str, str]):
+        account = ParticipantAccount(participant["user_id"], participant["current_budget"])
+        for player_id in participant.get("squad", []):
+            position = positions.get(player_id)
+            if position:
+                account.squad_counts[position] = account.squad_counts.get(position, 0) + 1
+        self.accounts[account.user_id] = account
+
+    def spendable(self, auction_id: str, user_id: str) -> int:
+        """Most a participant can bid on an auction right now"""
+        account = self.accounts.get(user_id)
+        if account is None:
+            return 0
+        # A leader raising their own bid may reuse the funds of the bid it replaces
+        leader_id, leader_amount, _ = self.reservations.get(auction_id, (None, 0, None))
+        return account.available + (leader_amount if leader_id == user_id else 0)
+
+    def hold(self, auction_id: str, user_id: str, amount: int, position: str) -> Hold:
+        """Validate a bid in O(1) and set its funds aside; raises BidRejected if it cannot be afforded"""
+        account = self.accounts.get(user_id)
+        if account is None:
+            raise BidRejected("You are not a participant in this tournament", status_code=403)
+
+        already_leading = self.reservations.get(auction_id, (None,))[0] == user_id
+        spendable = self.spendable(auction_id, user_id)
+        if amount > spendable:
+            raise BidRejected(f"Insufficient budget: ${spendable} available")
+
+        limit = self.squad_limits.get(position)
+        if limit is not None and not already_leading:
+            taken = account.squad_counts.get(position, 0) + account.leading_counts.get(position, 0)
+            if taken >= limit:
+                raise BidRejected(f"Squad is full for {position}")
+
+        account.reserved += amount
+        return Hold(self, auction_id, user_id, amount, position)
+
+    def restore(self, auction_id: str, user_id: str, amount: int, position: Optional[str]):
+        """Reserve the funds of a bid that was already leading when the ledger was loaded"""
+        account = self.accounts.get(user_id)
+        if account is None:
+            return
+        account.reserved += amount
+        account.leading_counts[position] = account.leading_counts.get(position, 0) + 1
+        self.reservations[auction_id] = (user_id, amount, position)
+
+    def cancel(self, hold: Hold):
+        """Give back the funds of a bid that was not accepted"""
+        account = self.accounts.get(hold.user_id)
+        if account:
+            account.reserved -= hold.amount
+
+    def commit(self, hold: Hold):
+        """Make an accepted bid the auction's reservation, releasing the bid it outbid"""
+        if hold.auction_id in self.settled:
+            # Settlement ran while this bid was being accepted; nothing would ever release it
+            self.cancel(hold)
+            return
+        previous = self.reservations.get(hold.auction_id)
+        if previous and previous[1] >= hold.amount:
+            # A higher bid was committed first, so this one is already outbid
+            self.cancel(hold)
+            return
+        if previous:
+            self._release(previous)
+
+        account = self.accounts[hold.user_id]
+        account.leading_counts[hold.position] = account.leading_counts.get(hold.position, 0) + 1
+        self.reservations[hold.auction_id] = (hold.user_id, hold.amount, hold.position)
+
+    def _release(self, reservation: Tuple[str, int, str]):
+        user_id, amount, position = reservation
+        account = self.accounts.get(user_id)
+        if account:
+            account.reserved -= amount
+            account.leading_counts[position] = account.leading_counts.get(position, 1) - 1
+
+    def settle(self, auction_id: str, winner_id: Optional[str], amount: int, position: str):
+        """Turn the winning reservation into spent budget and a filled squad slot"""
+        self.settled.add(auction_id)
+        reservation = self.reservations.pop(auction_id, None)
+        if reservation:
+            self._release(reservation)
+
+        account = self.accounts.get(winner_id) if winner_id else None
+        if account:
+            account.current_budget -= amount
+            account.squad_counts[position] = account.squad_counts.get(position, 0) + 1
+
+class SharedTournamentLedger:
+    """Reservations held in Mongo, so every process accepting bids checks the same balances.
+
+    Each participant's reserved funds are a counter on their tournament
+    entry, raised only by a conditional $inc that fails when the bid cannot
+    be afforded. The leading bid of every auction is one document in
+    budget_reservations; settlement marks it settled so a late commit is
+    released instead of leaking.
+    """
+
+    def __init__(self, tournament_id: str, squad_limits: Dict[str, int]):
+        self.tournament_id = tournament_id
+        self.squad_limits = squad_limits
+
+    async def spendable(self, auction_id: str, user_id: str, db) -> int:
+        """Most a participant can bid on an auction right now"""
+        participant = await self._participant(user_id, db)
+        if participant is None:
+            return 0
+        reservation = await db.budget_reservations.find_one({"auction_id": auction_id})
+        return self._spendable(participant, self._basis(reservation, user_id))
+
+    async def hold(self, auction_id: str, user_id: str, amount: int, position: Optional[str], db) -> Hold:
+        """Validate a bid and reserve its funds in Mongo; raises BidRejected if it cannot be afforded"""
+        participant = await self._participant(user_id, db)
+        if participant is None:
+            raise BidRejected("You are not a participant in this tournament", status_code=403)
+        reservation = await db.budget_reservations.find_one({"auction_id": auction_id})
+        if reservation and reservation.get("settled"):
+            raise BidRejected("Auction has ended")
+        basis = self._basis(reservation, user_id)
+
+        limit = self.squad_limits.get(position)
+        if limit is not None and not basis:
+            # Squad slots are checked from reads; only the budget needs the conditional write
+            squad = await db.players.count_documents({"id": {"$in": participant.get("squad", [])}, "position": position})
+            leading = await db.budget_reservations.count_documents({
+                "tournament_id": self.tournament_id, "user_id": user_id, "position": position, "settled": {"$ne": True}
+            })
+            if squad + leading >= limit:
+                raise BidRejected(f"Squad is full for {position}")
+
+        extra = amount - basis
+        result = await db.tournaments.update_one(
+            {
+                "id": self.tournament_id,
+                "participants.user_id": user_id,
+                "$expr": {"$gt": [{"$size": {"$filter": {"input": "$participants", "cond": {"$and": [
+                    {"$eq": ["$$this.user_id", user_id]},
+                    {"$gte": [{"$subtract": ["$$this.current_budget", {"$ifNull": ["$$this.reserved", 0]}]}, extra]}
+                ]}}}}, 0]}
+            },
+            {"$inc": {"participants.$.reserved": extra}}
+        )
+        if not result.modified_count:
+            spendable = await self.spendable(auction_id, user_id, db)
+            raise BidRejected(f"Insufficient budget: ${spendable} available")
+        return Hold(self, auction_id, user_id, amount, position, basis)
+
+    async def cancel(self, hold: Hold, db):
+        """Give back the funds of a bid that was not accepted"""
+        await self._adjust({hold.user_id: -(hold.amount - hold.basis)}, db)
+
+    async def commit(self, hold: Hold, db):
+        """Make an accepted bid the auction's reservation, releasing the bid it outbid"""
+        try:
+            previous = await db.budget_reservations.find_one_and_update(
+                {"auction_id": hold.auction_id, "settled": {"$ne": True}, "amount": {"$lt": hold.amount}},
+                {"$set": {"tournament_id": self.tournament_id, "user_id": hold.user_id,
+                          "amount": hold.amount, "position": hold.position}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # Already outbid by a higher commit, or the auction was settled meanwhile
+            await self.cancel(hold, db)
+            return
+
+        # The hold reserved only the increase over the bidder's own reservation, which the swap releases
+        deltas = {hold.user_id: hold.basis}
+        if previous and previous.get("user_id"):
+            deltas[previous["user_id"]] = deltas.get(previous["user_id"], 0) - previous["amount"]
+        await self._adjust(deltas, db)
+
+    async def settle(self, auction_ids: List[str], db):
+        """Release the leading reservations of ended auctions and stop later commits from taking new ones"""
+        deltas: Dict[str, int] = {}
+        for auction_id in auction_ids:
+            try:
+                previous = await db.budget_reservations.find_one_and_update(
+                    {"auction_id": auction_id, "settled": {"$ne": True}},
+                    {"$set": {"tournament_id": self.tournament_id, "settled": True}},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+            except DuplicateKeyError:
+                continue  # settled before
+            if previous and previous.get("user_id"):
+                deltas[previous["user_id"]] = deltas.get(previous["user_id"], 0) - previous["amount"]
+        await self._adjust(deltas, db)
+
+    async def _participant(self, user_id: str, db) -> Optional[dict]:
+        tournament = await db.tournaments.find_one(
+            {"id": self.tournament_id}, {"_id": 0, "participants": {"$elemMatch": {"user_id": user_id}}}
+        )
+        return tournament["participants"][0] if tournament and tournament.get("participants") else None
+
+    def _basis(self, reservation: Optional[dict], user_id: str) -> int:
+        if reservation and not reservation.get("settled") and reservation.get("user_id") == user_id:
+            return reservation["amount"]
+        return 0
+
+    def _spendable(self, participant: dict, basis: int) -> int:
+        return participant["current_budget"] - participant.get("reserved", 0) + basis
+
+    async def _adjust(self, deltas: Dict[str, int], db):
+        updates = [
+            UpdateOne({"id": self.tournament_id, "participants.user_id": user_id}, {"$inc": {"participants.$.reserved": delta}})
+            for user_id, delta in deltas.items() if delta
+        ]
+        if updates:
+            await db.tournaments.bulk_write(updates, ordered=False)
+
+class BudgetLedgerManager:
+    """Budget and squad checks for bids.
+
+    A single process accepting every bid keeps the ledger in memory and
+    checks bids in O(1); with `shared`, reservations are held in Mongo so
+    several processes see the same balances.
+    """
+
+    def __init__(self, shared: bool = False):
+        self.shared = shared
+        self.ledgers: Dict[str, TournamentLedger] = {}
+        self.auction_meta: Dict[str, Tuple[str, str]] = {}  # auction_id -> (tournament_id, position)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def for_auction(self, auction_id: str, db) -> Tuple[Optional[TournamentLedger], Optional[str]]:
+        """Ledger and player position for an auction, loading both from Mongo on first access"""
+        meta = self.auction_meta.get(auction_id)
+        if meta is None:
+            auction = await db.auctions.find_one({"id": auction_id}, {"tournament_id": 1, "player_id": 1})
+            if not auction:
+                return None, None
+            player = await db.players.find_one({"id": auction["player_id"]}, {"position": 1})
+            meta = self.auction_meta[auction_id] = (auction["tournament_id"], _position(player))
+
+        tournament_id, position = meta
+        return await self.get(tournament_id, db), position
+
+    async def get(self, tournament_id: str, db) -> Optional[TournamentLedger]:
+        """Get a tournament's ledger, seeding it from the tournament document once"""
+        ledger = self.ledgers.get(tournament_id)
+        if ledger:
+            return ledger
+
+        lock = self._locks.setdefault(tournament_id, asyncio.Lock())
+        async with lock:
+            ledger = self.ledgers.get(tournament_id)
+            if ledger:
+                return ledger
+
+            tournament = await db.tournaments.find_one({"id": tournament_id})
+            if not tournament:
+                return None
+
+            composition = tournament.get("squad_composition", {})
+            squad_limits = {position: composition[field] for position, field in POSITION_SLOTS.items() if field in composition}
+            if self.shared:
+                # Balances are read from Mongo on every check; only the squad limits are kept
+                ledger = self.ledgers[tournament_id] = SharedTournamentLedger(tournament_id, squad_limits)
+                self._locks.pop(tournament_id, None)
+                return ledger
+            ledger = TournamentLedger(tournament_id, squad_limits)
+
+            # Bids already leading when the ledger loads, e.g. after a restart mid-auction, keep their funds reserved
+            live_auctions = await db.auctions.find(
+                {"tournament_id": tournament_id, "is_active": True},
+                {"_id": 0, "id": 1, "player_id": 1, "current_bid": 1, "highest_bidder_id": 1}
+            ).to_list(None)
+
+            participants = tournament.get("participants", [])
+            player_ids = [player_id for p in participants for player_id in p.get("squad", [])]
+            player_ids += [auction["player_id"] for auction in live_auctions]
+            positions = {}
+            if player_ids:
+                players = await db.players.find({"id": {"$in": player_ids}}, {"id": 1, "position": 1}).to_list(None)
+                positions = {p["id"]: _position(p) for p in players}
+            for participant in participants:
+                ledger.add_participant(participant, positions)
+
+            for auction in live_auctions:
+                position = positions.get(auction["player_id"])
+                self.auction_meta[auction["id"]] = (tournament_id, position)
+                # A resident bid book is ahead of Mongo while its writes are in flight
+                book = bid_books.books.get(auction["id"])
+                leader_id, amount = (book.highest_bidder_id, book.current_bid) if book else (
+                    auction.get("highest_bidder_id"), auction["current_bid"]
+                )
+                if leader_id:
+                    ledger.restore(auction["id"], leader_id, amount, position)
+
+            self.ledgers[tournament_id] = ledger
+            self._locks.pop(tournament_id, None)
+            return ledger
+
+    def add_participant(self, tournament_id: str, participant: dict):
+        """Keep a resident ledger in step with a newly joined participant"""
+        ledger = self.ledgers.get(tournament_id)
+        if isinstance(ledger, TournamentLedger) and participant["user_id"] not in ledger.accounts:
+            ledger.add_participant(participant, {})
+
+    async def hold(self, auction_id: str, user_id: str, amount: int, db) -> Optional[Hold]:
+        """Check a bid against its tournament's ledger and set its funds aside; None if it has no ledger"""
+        ledger, position = await self.for_auction(auction_id, db)
+        if ledger is None:
+            return None
+        if not self.shared:
+            return ledger.hold(auction_id, user_id, amount, position)
+        try:
+            return await ledger.hold(auction_id, user_id, amount, position, db)
+        except BidRejected:
+            raise
+        except Exception as e:
+            # A bid that cannot be budget-checked is refused rather than let through
+            logger.error(f"Could not check budget for bid on auction {auction_id}: {e}")
+            raise BidRejected("Budget could not be checked, please try again", status_code=503)
+
+    async def cancel(self, hold: Hold, db):
+        """Give back the funds of a bid that was not accepted"""
+        if self.shared:
+            await self._shared_write(hold.ledger.cancel(hold, db), hold)
+        else:
+            hold.ledger.cancel(hold)
+
+    async def commit(self, hold: Hold, db):
+        """Make an accepted bid its auction's reservation"""
+        if self.shared:
+            await self._shared_write(hold.ledger.commit(hold, db), hold)
+        else:
+            hold.ledger.commit(hold)
+
+    async def _shared_write(self, write, hold: Hold):
+        # The bid's outcome is already decided; a failed reservation update is logged, not surfaced
+        try:
+            await write
+        except Exception as e:
+            logger.error(f"Could not update budget reservation of {hold.user_id} on auction {hold.auction_id}: {e}")
+
+    async def spendable(self, auction_id: str, user_id: str, db) -> Optional[int]:
+        """Most a participant can bid on an auction, or None if it has no ledger"""
+        ledger, _ = await self.for_auction(auction_id, db)
+        if ledger is None:
+            return None
+        if self.shared:
+            return await ledger.spendable(auction_id, user_id, db)
+        return ledger.spendable(auction_id, user_id)
+
+    async def settle(self, auction: dict, winner_id: Optional[str], amount: int, db):
+        """Charge the winner of an ended auction, in memory and with an atomic $inc in Mongo"""
+        await self.settle_many([(auction, winner_id, amount)], db)
+
+    async def settle_many(self, settlements: List[Tuple[dict, Optional[str], int]], db):
+        """Charge the winners of a batch of ended auctions with one bulk write of atomic $incs.
+
+        Reservations are always released; only winners whose update reached
+        Mongo are charged in memory too, so the ledger never drifts from it.
+        """
+        if self.shared:
+            by_tournament: Dict[str, List[str]] = {}
+            for auction, _, _ in settlements:
+                by_tournament.setdefault(auction["tournament_id"], []).append(auction["id"])
+            for tournament_id, auction_ids in by_tournament.items():
+                ledger = await self.get(tournament_id, db)
+                if ledger:
+                    try:
+                        await ledger.settle(auction_ids, db)
+                    except Exception as e:
+                        logger.error(f"Could not release budget reservations of auctions {auction_ids}: {e}")
+        charged = [i for i, (_, winner_id, _) in enumerate(settlements) if winner_id]
+        updates = [
+            UpdateOne(
+                {"id": auction["tournament_id"], "participants.user_id": winner_id},
+                {
+                    "$inc": {"participants.$.current_budget": -amount},
+                    "$push": {"participants.$.squad": auction["player_id"]}
+                }
+            )
+            for auction, winner_id, amount in (settlements[i] for i in charged)
+        ]
+        failed = set()
+        if updates:
+            try:
+                await db.tournaments.bulk_write(updates, ordered=False)
+            except BulkWriteError as e:
+                # Unordered, so every update without a write error was applied
+                failed = {charged[error["index"]] for error in e.details.get("writeErrors", [])}
+                logger.error(f"Could not charge {len(failed)} of {len(updates)} auction winners: {e.details.get('writeErrors')}")
+            except Exception as e:
+                failed = set(charged)
+                logger.error(f"Could not charge auction winners: {e}")
+
+        resident = []
+        for i, (auction, winner_id, amount) in enumerate(settlements):
+            tournament_id = auction["tournament_id"]
+            position = (self.auction_meta.pop(auction["id"], None) or (tournament_id, None))[1]
+            ledger = self.ledgers.get(tournament_id)
+            if ledger and not self.shared:
+                if i in failed:
+                    winner_id, amount = None, 0
+                resident.append((ledger, auction, winner_id, amount, position))
+
+        # Positions not cached from bidding are looked up together
+        unknown = [auction["player_id"] for _, auction, winner_id, _, position in resident if winner_id and position is None]
+        positions = {}
+        if unknown:
+            try:
+                players = await db.players.find({"id": {"$in": unknown}}, {"id": 1, "position": 1}).to_list(None)
+                positions = {p["id"]: _position(p) for p in players}
+            except Exception as e:
+                logger.error(f"Could not look up positions of won players: {e}")
+        for ledger, auction, winner_id, amount, position in resident:
+            ledger.settle(auction["id"], winner_id, amount, position or positions.get(auction["player_id"]))
+
+    def get_stats(self) -> dict:
+        return {
+            "shared": self.shared,
+            "tournaments": len(self.ledgers),
+            "reservations": sum(len(getattr(ledger, "reservations", ())) for ledger in self.ledgers.values())
+        }
+
+# Global budget ledger manager instance. Reservations are held in Mongo whenever more than one
+# process may accept bids (atomic mode, or timer leases shared over the bus)
+budget_ledgers = BudgetLedgerManager(shared=bid_books.mode == "atomic" or timer_leases.enabled)
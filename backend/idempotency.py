@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '600'))
+
+class IdempotencyCacheFull(Exception):
+    """Raised when every cached entry is still in flight, so a new key cannot be tracked"""
+
+class IdempotencyCache:
+    """Bounded TTL cache of request results keyed by client-supplied idempotency keys.
+
+    Entries hold a future, so a retry that arrives while the original request
+    is still in flight waits for the same result instead of running twice.
+    """
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[float, asyncio.Future]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0, "rejected": 0}
+
+    def get(self, *key: str) -> Optional[asyncio.Future]:
+        """Future of an earlier request with the same key, if still cached"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def reserve(self, *key: str) -> asyncio.Future:
+        """Claim a key for a request that is about to run; raises IdempotencyCacheFull if there is no room"""
+        if not self._evict():
+            self.stats["rejected"] += 1
+            raise IdempotencyCacheFull(f"{len(self._entries)} idempotent requests already in flight")
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, future)
+        self._entries.move_to_end(key)
+        return future
+
+    def complete(self, key: Tuple[str, ...], result: Any):
+        """Store the result of a reserved key and release waiting retries"""
+        entry = self._entries.get(key)
+        if entry and not entry[1].done():
+            entry[1].set_result(result)
+
+    def discard(self, key: Tuple[str, ...], exc: BaseException):
+        """Forget a key whose request failed so the client may retry it"""
+        entry = self._entries.pop(key, None)
+        if entry and not entry[1].done():
+            entry[1].set_exception(exc)
+            # Retrieve it so a failure nobody waited on is not reported as unhandled
+            entry[1].exception()
+
+    def _evict(self) -> bool:
+        """Make room for one more entry; False if every entry is still in flight"""
+        # All entries share one TTL, so expired ones are always at the front
+        now = time.monotonic()
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at >= now:
+                break
+            del self._entries[key]
+            self.stats["evicted"] += 1
+
+        # Live entries only go to make room, oldest finished first; in-flight requests keep theirs
+        while len(self._entries) >= self.max_entries:
+            key = next((key for key, (_, future) in self._entries.items() if future.done()), None)
+            if key is None:
+                return False
+            del self._entries[key]
+            self.stats["evicted"] += 1
+        return True
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self._entries)}
+
+# Global idempotency cache for bid submission
+idempotency_cache = IdempotencyCache()
@@ -0,0 +1,116 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ProxyBidEngine:
+    """Resolves automatic bidding wars between registered maximum bids"""
+
+    def __init__(self):
+        self.proxies: Dict[str, Dict[str, dict]] = {}  # auction_id -> user_id -> proxy bid
+        self._loaded: Set[str] = set()
+
+    async def load(self, auction_id: str, db) -> Dict[str, dict]:
+        """Get the active proxies of an auction, loading them from Mongo on first access"""
+        if auction_id not in self._loaded:
+            proxies = await db.proxy_bids.find({"auction_id": auction_id, "is_active": True}).to_list(None)
+            self.proxies[auction_id] = {p["user_id"]: p for p in proxies}
+            self._loaded.add(auction_id)
+        return self.proxies.get(auction_id, {})
+
+    async def register(self, proxy: dict, db):
+        """Register or replace a user's maximum bid for an auction"""
+        proxies = await self.load(proxy["auction_id"], db)
+        await db.proxy_bids.update_many(
+            {"auction_id": proxy["auction_id"], "user_id": proxy["user_id"], "is_active": True},
+            {"$set": {"is_active": False}}
+        )
+        await db.proxy_bids.insert_one(dict(proxy))
+        proxies[proxy["user_id"]] = proxy
+        await self.audit(db, proxy["auction_id"], "registered", proxy["user_id"], {"max_amount": proxy["max_amount"]})
+
+    async def cancel(self, auction_id: str, user_id: str, db) -> bool:
+        """Withdraw a user's maximum bid; returns False if there was none"""
+        proxies = await self.load(auction_id, db)
+        if user_id not in proxies:
+            return False
+        del proxies[user_id]
+        await db.proxy_bids.update_many(
+            {"auction_id": auction_id, "user_id": user_id, "is_active": True},
+            {"$set": {"is_active": False}}
+        )
+        await self.audit(db, auction_id, "cancelled", user_id, {})
+        return True
+
+    async def reject(self, auction_id: str, user_id: str, reason: str, db) -> Optional[dict]:
+        """Withdraw a maximum bid whose owner can no longer place its bids"""
+        proxy = self.proxies.get(auction_id, {}).pop(user_id, None)
+        if not proxy:
+            return None
+        await db.proxy_bids.update_many(
+            {"auction_id": auction_id, "user_id": user_id, "is_active": True},
+            {"$set": {"is_active": False}}
+        )
+        await self.audit(db, auction_id, "rejected", user_id, {"max_amount": proxy["max_amount"], "reason": reason})
+        return proxy
+
+    def resolve(self, auction_id: str, current_bid: int, leader_id: Optional[str],
+                min_increment: int) -> Optional[Tuple[dict, int, List[str]]]:
+        """Work out the bid the proxy war settles on.
+
+        Returns (proxy, amount, exhausted_user_ids) for the single effective
+        bid to place, or None when no proxy can or needs to respond.
+        """
+        proxies = self.proxies.get(auction_id)
+        if not proxies:
+            return None
+
+        min_bid = current_bid + min_increment
+        exhausted = [
+            user_id for user_id, p in proxies.items()
+            if user_id != leader_id and p["max_amount"] < min_bid
+        ]
+        challengers = [
+            p for user_id, p in proxies.items()
+            if user_id != leader_id and p["max_amount"] >= min_bid
+        ]
+        if not challengers:
+            return (None, 0, exhausted) if exhausted else None
+
+        # Highest maximum wins; the earlier registration wins a tie
+        challengers.sort(key=lambda p: (-p["max_amount"], p["created_at"]))
+        best = challengers[0]
+        leader_proxy = proxies.get(leader_id)
+        leader_ceiling = max(current_bid, leader_proxy["max_amount"]) if leader_proxy else current_bid
+
+        if best["max_amount"] > leader_ceiling:
+            runner_up = max([leader_ceiling] + [p["max_amount"] for p in challengers[1:]])
+            return best, min(best["max_amount"], runner_up + min_increment), exhausted
+
+        # The leader's own proxy defends just above the strongest challenger
+        exhausted.extend(p["user_id"] for p in challengers)
+        return leader_proxy, min(leader_ceiling, best["max_amount"] + min_increment), exhausted
+
+    def retire(self, auction_id: str, user_ids: List[str]) -> List[dict]:
+        """Drop proxies that can no longer beat the current price"""
+        proxies = self.proxies.get(auction_id, {})
+        return [proxies.pop(user_id) for user_id in user_ids if user_id in proxies]
+
+    async def audit(self, db, auction_id: str, event: str, user_id: Optional[str], details: dict):
+        """Append an entry to the proxy bidding audit trail"""
+        await db.proxy_bid_audit.insert_one({
+            "auction_id": auction_id,
+            "event": event,
+            "user_id": user_id,
+            "details": details,
+            "timestamp": datetime.utcnow()
+        })
+
+    def remove(self, auction_id: str):
+        """Forget the proxies of an ended auction"""
+        self.proxies.pop(auction_id, None)
+        self._loaded.discard(auction_id)
+
+# Global proxy bidding engine instance
+proxy_engine = ProxyBidEngine()
@@ -0,0 +1,103 @@
+import logging
+import os
+import time
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+BID_RATE_USER_PER_SECOND = float(os.environ.get('BID_RATE_USER_PER_SECOND', '2'))
+BID_RATE_USER_BURST = float(os.environ.get('BID_RATE_USER_BURST', '5'))
+BID_RATE_AUCTION_PER_SECOND = float(os.environ.get('BID_RATE_AUCTION_PER_SECOND', '50'))
+BID_RATE_AUCTION_BURST = float(os.environ.get('BID_RATE_AUCTION_BURST', '100'))
+BID_RATE_IDLE_SECONDS = float(os.environ.get('BID_RATE_IDLE_SECONDS', '60'))
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+class TokenBucketLimiter:
+    """Lazily refilled token buckets; idle buckets are dropped since they would be full anyway"""
+
+    def __init__(self, rate: float, burst: float, idle_seconds: float = BID_RATE_IDLE_SECONDS):
+        self.rate = rate
+        self.burst = burst
+        # A bucket idle this long has refilled completely, so forgetting it changes nothing
+        self.idle_seconds = max(idle_seconds, burst / rate if rate > 0 else idle_seconds)
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self._next_sweep = time.monotonic() + self.idle_seconds
+
+    def acquire(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Take one token; returns 0 if allowed, otherwise seconds until a token is available"""
+        now = now if now is not None else time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate if self.rate > 0 else self.idle_seconds
+
+    def refund(self, key: Hashable):
+        """Give back a token taken for a request that was rejected elsewhere"""
+        bucket = self.buckets.get(key)
+        if bucket:
+            bucket.tokens = min(self.burst, bucket.tokens + 1)
+
+    def _sweep(self, now: float):
+        cutoff = now - self.idle_seconds
+        for key in [k for k, b in self.buckets.items() if b.updated_at < cutoff]:
+            del self.buckets[key]
+        self._next_sweep = now + self.idle_seconds
+
+class BidRateLimiter:
+    """Per (user, auction) and per auction throttling of the bid path"""
+
+    def __init__(self):
+        self.per_user = TokenBucketLimiter(BID_RATE_USER_PER_SECOND, BID_RATE_USER_BURST)
+        self.per_auction = TokenBucketLimiter(BID_RATE_AUCTION_PER_SECOND, BID_RATE_AUCTION_BURST)
+        self.stats = {"allowed": 0, "rejected_user": 0, "rejected_auction": 0}
+
+    def check(self, user_id: str, auction_id: str) -> float:
+        """Returns 0 if the bid may proceed, otherwise the Retry-After delay in seconds"""
+        now = time.monotonic()
+        user_key = (user_id, auction_id)
+
+        retry_after = self.per_user.acquire(user_key, now)
+        if retry_after:
+            self.stats["rejected_user"] += 1
+            return retry_after
+
+        retry_after = self.per_auction.acquire(auction_id, now)
+        if retry_after:
+            self.per_user.refund(user_key)
+            self.stats["rejected_auction"] += 1
+            return retry_after
+
+        self.stats["allowed"] += 1
+        return 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "user_buckets": len(self.per_user.buckets),
+            "auction_buckets": len(self.per_auction.buckets),
+            "limits": {
+                "user_per_second": self.per_user.rate,
+                "user_burst": self.per_user.burst,
+                "auction_per_second": self.per_auction.rate,
+                "auction_burst": self.per_auction.burst
+            }
+        }
+
+# Global bid rate limiter instance
+bid_rate_limiter = BidRateLimiter()
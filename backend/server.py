@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,18 +8,27 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
 import uuid
 from datetime import datetime, timedelta
 import bcrypt
 import jwt
 from enum import Enum
 import asyncio
+import math
 
 # Import our custom modules
 from websocket_manager import manager
 from auction_timer import auction_timer
 from achievements import achievement_manager, Achievement
+from bid_book import bid_books, BidRejected
+from bid_journal import bid_journal, BID_DURABILITY_MODE
+from proxy_bidding import proxy_engine
+from idempotency import idempotency_cache, IdempotencyCacheFull
+from rate_limiter import bid_rate_limiter
+from bid_coalescer import bid_coalescer
+from budget_ledger import budget_ledgers
+from ws_router import ws_router, WebSocketSession
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -175,6 +185,8 @@ class Auction(BaseModel):
     min_increment: int = 25000
     winner_id: Optional[str] = None
     final_price: Optional[int] = None
+    winning_bid_id: Optional[str] = None
+    winning_bid_amount: Optional[int] = None
 
 class AuctionCreate(BaseModel):
     tournament_id: str
@@ -189,15 +201,49 @@ class Bid(BaseModel):
     amount: int
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     is_winning: bool = False
+    is_proxy: bool = False
 
 class BidCreate(BaseModel):
     amount: int
 
+class ProxyBid(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    auction_id: str
+    user_id: str
+    username: str
+    max_amount: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    is_active: bool = True
+
+class ProxyBidCreate(BaseModel):
+    max_amount: int
+
 class NotificationCreate(BaseModel):
     title: str
     message: str
     type: str = "info"  # info, success, warning, error
 
+# Inbound WebSocket messages, validated by ws_router before their handler runs
+class JoinAuctionMessage(BaseModel):
+    auction_id: str
+    username: str = "Anonymous"
+    last_seq: Optional[int] = None
+    stream: Optional[str] = None
+
+class LeaveAuctionMessage(BaseModel):
+    username: str = "Anonymous"
+
+class PlaceBidMessage(BaseModel):
+    auction_id: str
+    amount: int
+    request_id: Optional[Union[str, int]] = None
+
+class PingMessage(BaseModel):
+    pass
+
+class AuthMessage(BaseModel):
+    token: str
+
 class AuctionMessage(BaseModel):
     user_id: str
     username: str
@@ -326,34 +372,140 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+async def bid_rate_limit(auction_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Throttle bids before any database access; identity comes straight from the JWT"""
+    try:
+        user_id = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"]).get("sub")
+    except jwt.PyJWTError:
+        return  # get_current_user rejects the request
+    
+    retry_after = bid_rate_limiter.check(user_id, auction_id)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many bids, slow down",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
 def generate_invite_code() -> str:
     import random
     import string
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+async def authenticate_websocket(token: Optional[str], user_id: str) -> Tuple[Optional[User], Optional[float]]:
+    """Resolve the user behind a WebSocket connection once, from its auth message, with the token's expiry"""
+    if not token:
+        return None, None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except jwt.PyJWTError:
+        return None, None
+    if payload.get("sub") != user_id:
+        return None, None
+    
+    user = await db.users.find_one({"id": user_id})
+    return (User(**user), payload.get("exp")) if user else (None, None)
+
 # WebSocket endpoint for real-time features
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await manager.connect(websocket, user_id)
+async def websocket_endpoint(websocket: WebSocket, user_id: str, batch: bool = False, compress: bool = False):
+    # batch=1: the client accepts array frames; compress=1: it can inflate large binary frames
+    # The JWT arrives in an "auth" message, never in the URL, so it stays out of access and proxy logs
+    connection = await manager.connect(websocket, user_id, batch=batch, compress=compress)
+    session = WebSocketSession(connection)
     try:
         while True:
-            data = await websocket.receive_text()
-            message = eval(data)  # In production, use json.loads with proper validation
-            
-            if message.get("type") == "join_auction":
-                auction_id = message.get("auction_id")
-                username = message.get("username", "Anonymous")
-                await manager.join_auction(user_id, auction_id, username)
-                
-            elif message.get("type") == "leave_auction":
-                username = message.get("username", "Anonymous")
-                await manager.leave_auction(user_id, username)
-                
-            elif message.get("type") == "ping":
-                await manager.send_personal_message({"type": "pong"}, user_id)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            manager.touch(connection)
+            data = frame.get("text")
+            await ws_router.dispatch(session, data if data is not None else frame.get("bytes") or b"")
                 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        manager.disconnect(connection)
+
+async def send_ws_reply(session: WebSocketSession, message: dict):
+    await manager.send_to_connection(session.connection, message)
+
+ws_router.reply = send_ws_reply
+
+@ws_router.register("auth", AuthMessage)
+async def handle_auth(session: WebSocketSession, message: AuthMessage):
+    """Authenticate the socket; clients send this first so later messages run as the user, and again with a renewed token"""
+    session.user, session.expires_at = await authenticate_websocket(message.token, session.connection.user_id)
+    await manager.send_to_connection(session.connection, {"type": "auth_result", "success": session.user is not None})
+
+@ws_router.register("join_auction", JoinAuctionMessage)
+async def handle_join_auction(session: WebSocketSession, message: JoinAuctionMessage):
+    await manager.join_auction(
+        session.connection, message.auction_id, message.username,
+        last_seq=message.last_seq, stream_id=message.stream
+    )
+    # The client counts down locally from the authoritative deadline
+    sync = auction_timer.sync_message(message.auction_id)
+    if sync:
+        await manager.send_to_connection(session.connection, sync)
+
+@ws_router.register("leave_auction", LeaveAuctionMessage)
+async def handle_leave_auction(session: WebSocketSession, message: LeaveAuctionMessage):
+    await manager.leave_auction(session.connection, message.username)
+
+@ws_router.register("ping", PingMessage)
+async def handle_ping(session: WebSocketSession, message: PingMessage):
+    await manager.send_to_connection(session.connection, {"type": "pong"})
+
+@ws_router.register("pong", PingMessage)
+async def handle_pong(session: WebSocketSession, message: PingMessage):
+    pass  # answer to a server heartbeat; receiving it already marked the connection alive
+
+async def auction_snapshot(auction_id: str) -> Optional[dict]:
+    """Compact auction state for a client that missed more events than can be replayed"""
+    state = await bid_books.snapshot(auction_id, db)
+    if not state:
+        return None
+    book = bid_books.books.get(auction_id)
+    if book:
+        bids = list(book.recent_bids)[:10]
+    else:
+        bids = await db.bids.find({"auction_id": auction_id}).sort("timestamp", -1).to_list(10)
+    # Same public fields as GET /auctions/{id}/bids: no idempotency keys, winner taken from the pointer
+    winning_bid_id = state.get("winning_bid_id")
+    return jsonable_encoder({
+        "current_bid": state["current_bid"],
+        "highest_bidder_id": state.get("highest_bidder_id"),
+        "winning_bid_id": winning_bid_id,
+        "min_increment": state.get("min_increment", 25000),
+        "end_time": state.get("end_time"),
+        "is_active": state.get("is_active", True),
+        "bids": [
+            Bid(**{**bid, "is_winning": bid["id"] == winning_bid_id}).model_dump()
+            for bid in bids
+        ]
+    })
+
+manager.snapshot_provider = auction_snapshot
+
+@ws_router.register("place_bid", PlaceBidMessage)
+async def handle_websocket_bid(session: WebSocketSession, message: PlaceBidMessage):
+    """Place a bid received over the socket and reply with a correlated bid_result"""
+    reply = {"type": "bid_result", "request_id": message.request_id}
+    try:
+        if session.user is None:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        if session.expired():
+            raise HTTPException(status_code=401, detail="Token has expired")
+        retry_after = bid_rate_limiter.check(session.user.id, message.auction_id)
+        if retry_after:
+            reply["retry_after"] = math.ceil(retry_after)
+            raise HTTPException(status_code=429, detail="Too many bids, slow down")
+        bid = await submit_bid(message.auction_id, message.amount, session.user)
+        reply.update({"success": True, "bid": jsonable_encoder(bid)})
+    except HTTPException as e:
+        reply.update({"success": False, "status": e.status_code, "error": e.detail})
+    
+    # Only the tab that asked gets the reply; the bid itself reaches every tab via the auction room
+    await manager.send_to_connection(session.connection, reply)
 
 # Initialize database with cricket players and create indexes for performance
 async def init_db():
@@ -397,11 +549,25 @@ async def init_db():
         await db.auctions.create_index([("start_time", -1)])
         
         # Bids collection indexes
+        await db.bids.create_index([("id", 1)], unique=True)
         await db.bids.create_index([("auction_id", 1)])
         await db.bids.create_index([("user_id", 1)])
         await db.bids.create_index([("timestamp", -1)])
         await db.bids.create_index([("is_winning", 1)])
         await db.bids.create_index([("amount", -1)])
+        await db.bids.create_index(
+            [("user_id", 1), ("auction_id", 1), ("idempotency_key", 1)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}}
+        )
+        
+        # Proxy bidding collections
+        await db.proxy_bids.create_index([("auction_id", 1), ("user_id", 1), ("is_active", 1)])
+        await db.proxy_bid_audit.create_index([("auction_id", 1), ("timestamp", 1)])
+        
+        # Leading-bid reservations of the shared budget ledger, one per auction
+        await db.budget_reservations.create_index([("auction_id", 1)], unique=True)
+        await db.budget_reservations.create_index([("tournament_id", 1), ("user_id", 1), ("position", 1)])
         
         logger.info("Database indexes created successfully for optimal performance")
         
@@ -584,6 +750,7 @@ async def join_tournament(tournament_id: str, join_data: TournamentJoin, current
         {"id": tournament_id},
         {"$set": {"participants": [p.dict() for p in tournament_obj.participants]}}
     )
+    budget_ledgers.add_participant(tournament_id, participant.dict())
     
     return tournament_obj
 
@@ -630,82 +797,235 @@ async def create_auction(auction_data: AuctionCreate, current_user: User = Depen
     )
     
     await db.auctions.insert_one(auction.dict())
+    bid_books.create(auction.dict())
     
     # Start auction timer
     await auction_timer.start_auction_timer(auction.id, auction_data.duration_minutes * 60, db)
     
     return auction
 
-@api_router.post("/auctions/{auction_id}/bid", response_model=Bid)
-async def place_bid(auction_id: str, bid_data: BidCreate, current_user: User = Depends(get_current_user)):
-    auction = await db.auctions.find_one({"id": auction_id})
-    if not auction:
-        raise HTTPException(status_code=404, detail="Auction not found")
+@api_router.post("/auctions/{auction_id}/bid", response_model=Bid, dependencies=[Depends(bid_rate_limit)])
+async def place_bid(auction_id: str, bid_data: BidCreate, current_user: User = Depends(get_current_user),
+                    idempotency_key: Optional[str] = Header(None)):
+    if not idempotency_key:
+        return await submit_bid(auction_id, bid_data.amount, current_user)
     
-    auction_obj = Auction(**auction)
+    # A retried request returns the original bid without touching the database
+    key = (current_user.id, auction_id, idempotency_key)
+    original = idempotency_cache.get(*key)
+    if original:
+        return await asyncio.shield(original)
     
-    # Check if auction is active
-    if not auction_obj.is_active:
-        raise HTTPException(status_code=400, detail="Auction is not active")
-    
-    # Check if auction has ended
-    if auction_obj.end_time and datetime.utcnow() > auction_obj.end_time:
-        raise HTTPException(status_code=400, detail="Auction has ended")
-    
-    # Check minimum bid
-    min_bid = auction_obj.current_bid + auction_obj.min_increment
-    if bid_data.amount < min_bid:
-        raise HTTPException(status_code=400, detail=f"Minimum bid is ${min_bid}")
+    try:
+        idempotency_cache.reserve(*key)
+    except IdempotencyCacheFull as e:
+        logger.warning(f"Idempotency cache full: {e}")
+        raise HTTPException(status_code=503, detail="Too many bids in flight, please retry")
+    try:
+        bid = await submit_bid(auction_id, bid_data.amount, current_user, idempotency_key)
+    except HTTPException as e:
+        # The cache may have been evicted (or the bid taken on another worker); the unique index has the answer
+        stored = await db.bids.find_one({
+            "user_id": current_user.id, "auction_id": auction_id, "idempotency_key": idempotency_key
+        }) if e.status_code == 400 else None
+        if not stored:
+            idempotency_cache.discard(key, e)
+            raise
+        bid = Bid(**stored)
+    except Exception as e:
+        idempotency_cache.discard(key, e)
+        raise
     
+    idempotency_cache.complete(key, bid)
+    return bid
+
+async def submit_bid(auction_id: str, amount: int, current_user: User, idempotency_key: Optional[str] = None) -> Bid:
+    """Validate, accept and broadcast a bid; shared by the REST route and the WebSocket endpoint"""
     # Create bid
     bid = Bid(
         auction_id=auction_id,
         user_id=current_user.id,
         username=current_user.username,
-        amount=bid_data.amount,
+        amount=amount,
         is_winning=True
     )
     
-    # Update previous bids to not winning
-    await db.bids.update_many(
-        {"auction_id": auction_id},
-        {"$set": {"is_winning": False}}
-    )
+    # Validate and accept against the bid book or with one conditional write, depending on BID_ACCEPTANCE_MODE
+    bid_doc = bid.dict()
+    if idempotency_key:
+        bid_doc["idempotency_key"] = idempotency_key
+    try:
+        # During final-second storms, bids are coalesced so only the best one per window is written and broadcast
+        if bid_coalescer.applies(auction_timer.get_time_remaining(auction_id)):
+            state = await bid_coalescer.submit(auction_id, bid_doc, lambda doc: accept_bid(auction_id, doc))
+        else:
+            state = await accept_bid(auction_id, bid_doc)
+    except BidRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    # Let registered maximum bids answer before anything is broadcast
+    proxy_bid = await resolve_proxy_bids(auction_id, state)
+    if proxy_bid:
+        bid.is_winning = False
     
-    # Insert new bid
-    await db.bids.insert_one(bid.dict())
+    await announce_bid(auction_id, proxy_bid or bid)
     
-    # Update auction
-    await db.auctions.update_one(
-        {"id": auction_id},
-        {"$set": {
-            "current_bid": bid_data.amount,
-            "highest_bidder_id": current_user.id
-        }}
+    # Check achievements
+    await achievement_manager.check_achievements(
+        current_user.id, 
+        "place_bid", 
+        {"amount": amount, "auction_id": auction_id}, 
+        db
     )
     
+    return bid
+
+async def accept_bid(auction_id: str, bid_doc: dict) -> dict:
+    """Check the bidder's budget and squad slots against the tournament ledger, then accept the bid"""
+    hold = await budget_ledgers.hold(auction_id, bid_doc["user_id"], bid_doc["amount"], db)
+    try:
+        state = await bid_books.accept(auction_id, bid_doc, db)
+    except Exception:
+        if hold:
+            await budget_ledgers.cancel(hold, db)
+        raise
+    
+    if hold:
+        await budget_ledgers.commit(hold, db)
+    return state
+
+async def announce_bid(auction_id: str, bid: Bid):
+    """Extend the timer if needed and broadcast the auction's new leading bid"""
     # Extend timer if bid placed in final 30 seconds
     time_remaining = auction_timer.get_time_remaining(auction_id)
     if time_remaining and time_remaining <= 30:
-        await auction_timer.extend_auction_timer(auction_id, 30)
+        await auction_timer.extend_auction_timer(auction_id, 30, db)
     
     # Broadcast bid update via WebSocket
     await manager.broadcast_bid_update(auction_id, bid.dict())
+
+async def resolve_proxy_bids(auction_id: str, state: dict) -> Optional[Bid]:
+    """Settle a proxy bidding war and place only its final effective bid"""
+    final_bid = None
     
-    # Check achievements
-    await achievement_manager.check_achievements(
-        current_user.id, 
-        "place_bid", 
-        {"amount": bid_data.amount, "auction_id": auction_id}, 
-        db
+    # The bid that triggered this is already accepted, so a failure here must not stop it being announced
+    try:
+        await proxy_engine.load(auction_id, db)
+        
+        # Each round either places the settling bid or retires exhausted proxies, so this converges quickly
+        for _ in range(5):
+            outcome = proxy_engine.resolve(
+                auction_id, state["current_bid"], state.get("highest_bidder_id"), state.get("min_increment", 25000)
+            )
+            if not outcome:
+                break
+            
+            proxy, amount, exhausted = outcome
+            if proxy:
+                bid = Bid(
+                    auction_id=auction_id,
+                    user_id=proxy["user_id"],
+                    username=proxy["username"],
+                    amount=amount,
+                    is_winning=True,
+                    is_proxy=True
+                )
+                try:
+                    state = await accept_bid(auction_id, bid.dict())
+                except BidRejected as e:
+                    if e.status_code >= 500:
+                        logger.warning(f"Proxy bid for auction {auction_id} not recorded: {e}")
+                        break
+                    
+                    latest = await bid_books.snapshot(auction_id, db)
+                    if not latest or not latest.get("is_active", True):
+                        break
+                    if latest.get("end_time") and datetime.utcnow() > latest["end_time"]:
+                        break
+                    if (latest["current_bid"], latest.get("highest_bidder_id")) != (state["current_bid"], state.get("highest_bidder_id")):
+                        # Outbid while resolving; settle again against the new price
+                        state = latest
+                        continue
+                    
+                    # The price did not move, so the owner can no longer bid (budget, squad or membership)
+                    await proxy_engine.reject(auction_id, proxy["user_id"], str(e), db)
+                    await manager.send_notification(proxy["user_id"], {
+                        "type": "warning",
+                        "title": "Auto-bid stopped",
+                        "message": f"Your maximum bid could not be placed: {e}"
+                    })
+                    continue
+                
+                await proxy_engine.audit(db, auction_id, "resolved", proxy["user_id"], {"amount": amount, "bid_id": bid.id})
+                final_bid = bid
+            
+            # Challengers only lose to a defending proxy once its bid is in
+            for retired in proxy_engine.retire(auction_id, exhausted):
+                await proxy_engine.audit(db, auction_id, "exhausted", retired["user_id"], {"max_amount": retired["max_amount"]})
+                await manager.send_notification(retired["user_id"], {
+                    "type": "warning",
+                    "title": "Auto-bid limit reached",
+                    "message": f"Your maximum bid of ${retired['max_amount']} has been exceeded"
+                })
+    except Exception as e:
+        logger.error(f"Error resolving proxy bids for auction {auction_id}: {e}")
+    
+    return final_bid
+
+@api_router.post("/auctions/{auction_id}/proxy-bid", response_model=ProxyBid)
+async def register_proxy_bid(auction_id: str, proxy_data: ProxyBidCreate, current_user: User = Depends(get_current_user)):
+    state = await bid_books.snapshot(auction_id, db)
+    if not state:
+        raise HTTPException(status_code=404, detail="Auction not found")
+    if not state.get("is_active", True):
+        raise HTTPException(status_code=400, detail="Auction is not active")
+    
+    min_bid = state["current_bid"] + state.get("min_increment", 25000)
+    if state.get("highest_bidder_id") != current_user.id and proxy_data.max_amount < min_bid:
+        raise HTTPException(status_code=400, detail=f"Maximum bid must be at least ${min_bid}")
+    
+    spendable = await budget_ledgers.spendable(auction_id, current_user.id, db)
+    if spendable is not None and proxy_data.max_amount > spendable:
+        raise HTTPException(status_code=400, detail=f"Insufficient budget: ${spendable} available")
+    
+    proxy = ProxyBid(
+        auction_id=auction_id,
+        user_id=current_user.id,
+        username=current_user.username,
+        max_amount=proxy_data.max_amount
     )
+    await proxy_engine.register(proxy.dict(), db)
     
-    return bid
+    # The new maximum may immediately outbid the current leader
+    proxy_bid = await resolve_proxy_bids(auction_id, state)
+    if proxy_bid:
+        await announce_bid(auction_id, proxy_bid)
+    
+    return proxy
+
+@api_router.delete("/auctions/{auction_id}/proxy-bid")
+async def cancel_proxy_bid(auction_id: str, current_user: User = Depends(get_current_user)):
+    if not await proxy_engine.cancel(auction_id, current_user.id, db):
+        raise HTTPException(status_code=404, detail="No active maximum bid for this auction")
+    return {"message": "Maximum bid cancelled"}
 
 @api_router.get("/auctions/{auction_id}/bids", response_model=List[Bid])
 async def get_auction_bids(auction_id: str):
     bids = await db.bids.find({"auction_id": auction_id}).sort("timestamp", -1).to_list(100)
-    return [Bid(**bid) for bid in bids]
+    
+    # Derive "winning" from the auction's pointer; bids written before the pointer existed keep their stored flag
+    winning_bid_id = bid_books.get_winning_bid_id(auction_id)
+    if not winning_bid_id:
+        auction = await db.auctions.find_one({"id": auction_id}, {"winning_bid_id": 1})
+        winning_bid_id = auction.get("winning_bid_id") if auction else None
+    
+    result = []
+    for bid in bids:
+        bid_obj = Bid(**bid)
+        if winning_bid_id:
+            bid_obj.is_winning = bid_obj.id == winning_bid_id
+        result.append(bid_obj)
+    return result
 
 # New Achievement routes
 @api_router.get("/achievements", response_model=List[Achievement])
@@ -734,6 +1054,21 @@ async def get_live_stats():
         "websocket_connections": manager.get_online_users_count()
     }
 
+@api_router.get("/stats/metrics")
+async def get_internal_metrics():
+    """Counters of the in-process bidding components, for tuning limits and capacity"""
+    return {
+        "bid_books": bid_books.get_active_books_count(),
+        "bid_journal": bid_journal.get_stats(),
+        "bid_rate_limiter": bid_rate_limiter.get_stats(),
+        "bid_coalescer": bid_coalescer.get_stats(),
+        "budget_ledgers": budget_ledgers.get_stats(),
+        "auction_timer": auction_timer.get_stats(),
+        "websocket": manager.get_stats(),
+        "websocket_messages": ws_router.get_stats(),
+        "idempotency": idempotency_cache.get_stats()
+    }
+
 # Cricket data routes
 @api_router.post("/cricket/populate-players")
 async def populate_cricket_players():
@@ -881,8 +1216,21 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup_event():
     await init_db()
+    await manager.start()
+    
+    # Replay any journaled bids that never reached Mongo before bids are accepted again
+    if BID_DURABILITY_MODE == "journal" and bid_books.mode == "book":
+        await bid_journal.start(db)
+        bid_books.journal = bid_journal
+    
+    # Take this process's timer shards and resume the countdowns of auctions that were live when it last stopped
+    await auction_timer.start(db)
+    
     logger.info("SportX Cricket Auction API started with WebSocket support")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await bid_journal.stop()
+    await auction_timer.stop()
+    await manager.stop()
     client.close()
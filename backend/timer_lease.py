@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Set
+from pymongo.errors import DuplicateKeyError
+from broadcast_bus import BROADCAST_BUS
+
+logger = logging.getLogger(__name__)
+
+# With several API processes, auction timers are split into shards and each shard is run
+# by whichever process holds its lease; a single process can leave leases off and own everything
+AUCTION_TIMER_LEASES = os.environ.get(
+    'AUCTION_TIMER_LEASES', 'true' if BROADCAST_BUS == 'redis' else 'false'
+).lower() in ('1', 'true', 'yes')
+TIMER_LEASE_SHARDS = int(os.environ.get('TIMER_LEASE_SHARDS', '16'))
+TIMER_LEASE_TTL = float(os.environ.get('TIMER_LEASE_TTL', '10'))
+TIMER_LEASE_RENEW_INTERVAL = float(os.environ.get('TIMER_LEASE_RENEW_INTERVAL', '3'))
+
+def shard_of(auction_id: str, shards: int = TIMER_LEASE_SHARDS) -> int:
+    return zlib.crc32(auction_id.encode("utf-8")) % shards
+
+class TimerLeaseManager:
+    """Mongo leases deciding which process runs the timers of each shard of auctions.
+
+    A lease is a `timer_leases` document {_id: shard, owner, expires_at}.
+    Its owner renews it every renew interval; once it has expired, any
+    process may take it over with a conditional upsert, so a dead owner's
+    shards move within about one TTL. Live processes also heartbeat a
+    `timer_workers` document so shards are spread evenly between them.
+    """
+
+    def __init__(self, enabled: bool = AUCTION_TIMER_LEASES, shards: int = TIMER_LEASE_SHARDS,
+                 ttl: float = TIMER_LEASE_TTL, renew_interval: float = TIMER_LEASE_RENEW_INTERVAL):
+        self.enabled = enabled
+        self.shards = shards
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.owned: Set[int] = set()
+        self.on_acquired: Optional[Callable[[Set[int]], Awaitable[None]]] = None
+        self._valid_until = 0.0
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"renewals": 0, "acquired": 0, "lost": 0, "released": 0, "errors": 0}
+
+    def owns(self, auction_id: str) -> bool:
+        """Whether this process should run the auction's timer right now"""
+        if not self.enabled:
+            return True
+        # Stop acting on leases that could not be renewed before anyone else may take them over
+        return time.monotonic() < self._valid_until and shard_of(auction_id, self.shards) in self.owned
+
+    async def start(self, db):
+        """Claim a fair share of the shards, then keep renewing them in the background"""
+        if not self.enabled:
+            return
+        self._db = db
+        await db.timer_leases.create_index([("expires_at", 1)], expireAfterSeconds=0)
+        await db.timer_workers.create_index([("expires_at", 1)], expireAfterSeconds=0)
+        await self._renew()
+        self._task = asyncio.create_task(self._renew_loop())
+        logger.info(f"Timer lease owner {self.owner} holds shards {sorted(self.owned)}")
+
+    async def stop(self):
+        """Hand the shards back so another process takes over without waiting for the TTL"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._db is None:
+            return
+        try:
+            await self._db.timer_leases.delete_many({"owner": self.owner})
+            await self._db.timer_workers.delete_one({"_id": self.owner})
+        except Exception as e:
+            logger.error(f"Error releasing timer leases: {e}")
+        self.stats["released"] += len(self.owned)
+        self.owned = set()
+        self._valid_until = 0.0
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self._renew()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error renewing timer leases: {e}")
+                if self.owned and time.monotonic() >= self._valid_until:
+                    self.stats["lost"] += len(self.owned)
+                    logger.warning(f"Timer leases for shards {sorted(self.owned)} expired without renewal")
+                    self.owned = set()
+
+    async def _renew(self):
+        db = self._db
+        started = time.monotonic()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        await db.timer_workers.update_one({"_id": self.owner}, {"$set": {"expires_at": expires_at}}, upsert=True)
+        workers = await db.timer_workers.count_documents({"expires_at": {"$gt": now}})
+        fair_share = math.ceil(self.shards / max(1, workers))
+
+        if self.owned:
+            await db.timer_leases.update_many(
+                {"_id": {"$in": list(self.owned)}, "owner": self.owner},
+                {"$set": {"expires_at": expires_at}}
+            )
+        leases = await db.timer_leases.find({}, {"_id": 1, "owner": 1, "expires_at": 1}).to_list(None)
+        held = {lease["_id"] for lease in leases if lease["owner"] == self.owner and lease["expires_at"] > now}
+        taken = {lease["_id"] for lease in leases if lease["expires_at"] > now}
+
+        # Claim free or expired shards up to a fair share; random order keeps starting processes from colliding
+        free = [shard for shard in range(self.shards) if shard not in taken]
+        random.shuffle(free)
+        for shard in free:
+            if len(held) >= fair_share:
+                break
+            try:
+                await db.timer_leases.update_one(
+                    {"_id": shard, "expires_at": {"$lte": now}},
+                    {"$set": {"owner": self.owner, "expires_at": expires_at}},
+                    upsert=True
+                )
+                held.add(shard)
+            except DuplicateKeyError:
+                pass  # claimed by another process since the read
+
+        # Give back shards above the fair share so processes that joined later pick them up
+        excess = sorted(held)[fair_share:]
+        if excess:
+            await db.timer_leases.delete_many({"_id": {"$in": excess}, "owner": self.owner})
+            held.difference_update(excess)
+            self.stats["released"] += len(excess)
+
+        acquired = held - self.owned
+        lost = self.owned - held - set(excess)
+        self.stats["renewals"] += 1
+        self.stats["acquired"] += len(acquired)
+        self.stats["lost"] += len(lost)
+        if lost:
+            logger.warning(f"Timer leases for shards {sorted(lost)} were taken over")
+        self.owned = held
+        self._valid_until = started + self.ttl - self.renew_interval
+
+        if acquired and self.on_acquired:
+            await self.on_acquired(acquired)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "owner": self.owner,
+            "shards": self.shards,
+            "owned": sorted(self.owned),
+            **self.stats
+        }
+
+# Global timer lease manager instance
+timer_leases = TimerLeaseManager()
@@ -1,99 +1,523 @@
-import json
+import asyncio
 import logging
-from typing import Dict, List, Set
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
 from fastapi import WebSocket, WebSocketDisconnect
 from datetime import datetime
 
+from broadcast_bus import InProcessBus, auction_channel, broadcast_bus, user_channel
+from wire_format import MSGPACK_SUBPROTOCOL, Frame, batch_json, batch_msgpack, deflate, msgpack_available
+
 logger = logging.getLogger(__name__)
 
+# Outbound frames buffered per connection before the slow-consumer policy applies
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', '256'))
+# "drop_timer" sheds superseded timer_update frames first, "disconnect" closes the slow socket
+WS_SLOW_CONSUMER_POLICY = os.environ.get('WS_SLOW_CONSUMER_POLICY', 'drop_timer')
+# Frames that are superseded by the next one of the same type and may be dropped under pressure.
+# They are not sequenced either: a replayed timer_sync would carry a stale server_time.
+DROPPABLE_MESSAGE_TYPES = {"timer_update", "timer_sync"}
+# Sequenced events kept per auction for clients resuming after a reconnect
+WS_REPLAY_BUFFER_SIZE = int(os.environ.get('WS_REPLAY_BUFFER_SIZE', '256'))
+# How long an auction's event stream outlives the last local socket in its room
+WS_STREAM_RETENTION_SECONDS = float(os.environ.get('WS_STREAM_RETENTION_SECONDS', '120'))
+# Batching connections get everything queued within one loop tick, plus this many ms, as one array frame
+WS_BATCH_WINDOW_MS = float(os.environ.get('WS_BATCH_WINDOW_MS', '0'))
+WS_BATCH_MAX_MESSAGES = int(os.environ.get('WS_BATCH_MAX_MESSAGES', '64'))
+# JSON frames at least this large are deflated for connections that asked for compression
+WS_COMPRESS_THRESHOLD = int(os.environ.get('WS_COMPRESS_THRESHOLD', '4096'))
+# Connections silent this long get a server ping; silent past the timeout they are reaped.
+# The timeout leaves room for two missed 30 second client pings.
+WS_HEARTBEAT_INTERVAL = float(os.environ.get('WS_HEARTBEAT_INTERVAL', '25'))
+WS_HEARTBEAT_TIMEOUT = float(os.environ.get('WS_HEARTBEAT_TIMEOUT', '75'))
+# Joins and leaves are collected per auction and sent as one presence_delta frame per interval
+WS_PRESENCE_INTERVAL_MS = float(os.environ.get('WS_PRESENCE_INTERVAL_MS', '1000'))
+# Rooms larger than this get participant counts only, without the lists of who joined and left
+WS_PRESENCE_COUNTS_ONLY_ABOVE = int(os.environ.get('WS_PRESENCE_COUNTS_ONLY_ABOVE', '500'))
+
+def _wake_writers(connections: List["ClientConnection"]):
+    for connection in connections:
+        connection.wake()
+
+class ClientConnection:
+    """A socket with a bounded outbound queue drained by its own writer task"""
+
+    def __init__(self, websocket: WebSocket, user_id: str, on_failure: Callable[["ClientConnection"], None],
+                 max_queue: int = WS_SEND_QUEUE_SIZE, policy: str = WS_SLOW_CONSUMER_POLICY,
+                 wire_format: str = "json", batch: bool = False, compress: bool = False):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.user_id = user_id
+        self.wire_format = wire_format
+        self.batch = batch
+        # Binary frames already mean MessagePack, so only JSON connections use app-level compression
+        self.compress = compress and wire_format == "json"
+        self.auction_id: Optional[str] = None
+        self.username: Optional[str] = None
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue: Deque[Tuple[Frame, bool]] = deque()
+        self.last_seen = time.monotonic()
+        self.pinged_at = 0.0
+        self.dropped = 0
+        self.batched = 0
+        self.compressed = 0
+        self.closed = False
+        self._on_failure = on_failure
+        # Set only while the writer is parked on an empty queue, so a broadcast wakes idle writers
+        # and leaves busy ones, which drain the queue before they park again, alone
+        self._idle: Optional[asyncio.Future] = None
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: Frame, droppable: bool = False, wake: bool = True) -> bool:
+        """Queue a frame without waiting; returns False if the connection is too slow to keep.
+
+        With wake=False an idle writer is left parked for the caller to wake().
+        """
+        if self.closed:
+            return False
+
+        if len(self.queue) >= self.max_queue:
+            if self.policy != "drop_timer":
+                return False
+            # Make room by shedding the oldest superseded frame, so the newest state still goes out
+            for i, (_, queued_droppable) in enumerate(self.queue):
+                if queued_droppable:
+                    del self.queue[i]
+                    self.dropped += 1
+                    break
+            else:
+                if not droppable:
+                    return False
+                self.dropped += 1
+                return True
+
+        self.queue.append((frame, droppable))
+        if wake:
+            self.wake()
+        return True
+
+    @property
+    def idle(self) -> bool:
+        return self._idle is not None
+
+    def wake(self):
+        """Resume a writer parked on an empty queue"""
+        if self._idle is not None:
+            if not self._idle.done():
+                self._idle.set_result(None)
+            self._idle = None
+
+    async def _write_loop(self):
+        try:
+            loop = asyncio.get_running_loop()
+            while True:
+                if not self.queue:
+                    self._idle = loop.create_future()
+                    await self._idle
+                if self.batch and WS_BATCH_WINDOW_MS > 0:
+                    await asyncio.sleep(WS_BATCH_WINDOW_MS / 1000)
+                while self.queue:
+                    count = min(len(self.queue), WS_BATCH_MAX_MESSAGES) if self.batch else 1
+                    frames = [self.queue.popleft()[0] for _ in range(count)]
+                    payload = self._payload(frames)
+                    if isinstance(payload, bytes):
+                        await self.websocket.send_bytes(payload)
+                    else:
+                        await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error sending to user {self.user_id}: {e}")
+            self._on_failure(self)
+
+    def _payload(self, frames: List[Frame]) -> Union[str, bytes]:
+        # Each format is encoded by the first writer that needs it and shared by the rest
+        if len(frames) > 1:
+            self.batched += len(frames)
+        if self.wire_format == "msgpack":
+            return frames[0].msgpack() if len(frames) == 1 else batch_msgpack(frames)
+
+        text = frames[0].json() if len(frames) == 1 else batch_json(frames)
+        if self.compress and len(text) >= WS_COMPRESS_THRESHOLD:
+            self.compressed += 1
+            return frames[0].deflated() if len(frames) == 1 else deflate(text)
+        return text
+
+    async def close(self, code: int = 1000):
+        """Stop the writer and close the socket"""
+        self.shutdown()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def shutdown(self):
+        """Stop the writer and drop anything still queued"""
+        self.closed = True
+        self.queue.clear()
+        self._writer.cancel()
+
+class AuctionStream:
+    """Per-auction event sequence with a ring buffer of recent events.
+
+    The stream id changes whenever the sequence restarts (another worker,
+    a restart, an expired stream), so a client only resumes from an offset
+    that belongs to the same sequence.
+    """
+    __slots__ = ("id", "seq", "events")
+
+    def __init__(self, size: int = WS_REPLAY_BUFFER_SIZE):
+        self.id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.events: Deque[Tuple[int, Frame]] = deque(maxlen=size)
+
+    def append(self, frame: Frame) -> Frame:
+        self.seq += 1
+        sequenced = frame.with_fields(seq=self.seq, stream=self.id)
+        self.events.append((self.seq, sequenced))
+        return sequenced
+
+    def since(self, last_seq: int) -> Optional[List[Frame]]:
+        """Events after last_seq, or None if they are no longer all buffered"""
+        if last_seq > self.seq or last_seq < 0:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.events or self.events[0][0] > last_seq + 1:
+            return None
+        return [frame for seq, frame in self.events if seq > last_seq]
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.auction_participants: Dict[str, Set[str]] = {}  # auction_id -> set of user_ids
-        self.user_auctions: Dict[str, str] = {}  # user_id -> auction_id
-        
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"User {user_id} connected via WebSocket")
-        
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            
-        # Remove from auction participants
-        for auction_id, participants in self.auction_participants.items():
-            participants.discard(user_id)
-            
-        if user_id in self.user_auctions:
-            del self.user_auctions[user_id]
-            
-        logger.info(f"User {user_id} disconnected from WebSocket")
+    def __init__(self, bus=None):
+        # Connection registry keyed by connection id, with reverse indexes so
+        # every add/remove is O(1) and several tabs per user can coexist
+        self.connections: Dict[str, ClientConnection] = {}
+        # Connection ids ordered from least to most recently heard from
+        self._activity: "OrderedDict[str, None]" = OrderedDict()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.user_connections: Dict[str, Set[str]] = {}  # user_id -> connection ids
+        self.auction_connections: Dict[str, Set[str]] = {}  # auction_id -> connection ids
+        self.auction_users: Dict[str, Dict[str, int]] = {}  # auction_id -> user_id -> connections in the room
+        self.streams: Dict[str, AuctionStream] = {}
+        self._idle_streams: "OrderedDict[str, float]" = OrderedDict()  # auction_id -> when its room emptied
+        self._presence: Dict[str, Dict[str, Tuple[bool, Optional[str]]]] = {}  # auction_id -> user_id -> (joined, username)
+        self._room_totals: Dict[str, int] = {}  # auction_id -> participants on every worker at the last flush
+        self._tasks: Set[asyncio.Task] = set()
+        # Registered by the server: compact auction state for clients too far behind to replay
+        self.snapshot_provider: Optional[Callable[[str], Awaitable[Optional[dict]]]] = None
+        self.stats = {"dropped_frames": 0, "slow_consumer_disconnects": 0, "replayed_events": 0, "snapshots": 0,
+                      "batched_messages": 0, "compressed_frames": 0, "heartbeat_pings": 0, "reaped_connections": 0,
+                      "presence_frames": 0}
+        # Broadcasts go out through the bus so every worker delivers them to its own sockets
+        self.bus = bus or InProcessBus()
+        self.bus.attach(self._on_bus_message)
+        
+    async def connect(self, websocket: WebSocket, user_id: str, batch: bool = False,
+                      compress: bool = False) -> ClientConnection:
+        # JSON unless the client offers the MessagePack subprotocol and we can speak it
+        wire_format = "json"
+        if MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", []) and msgpack_available():
+            wire_format = "msgpack"
+        await websocket.accept(subprotocol=MSGPACK_SUBPROTOCOL if wire_format == "msgpack" else None)
+        connection = ClientConnection(websocket, user_id, self._connection_failed, wire_format=wire_format,
+                                      batch=batch, compress=compress)
+        self.connections[connection.id] = connection
+        self._activity[connection.id] = None
+        if user_id not in self.user_connections:
+            self.user_connections[user_id] = set()
+            self.bus.subscribe(user_channel(user_id))
+        self.user_connections[user_id].add(connection.id)
+        logger.info(f"User {user_id} connected via WebSocket ({connection.id})")
+        return connection
+        
+    def _connection_failed(self, connection: ClientConnection):
+        self.disconnect(connection)
+        
+    def _drop_slow_consumer(self, connection: ClientConnection):
+        self.stats["slow_consumer_disconnects"] += 1
+        logger.warning(f"Disconnecting slow consumer {connection.user_id} ({len(connection.queue)} frames queued)")
+        self.disconnect(connection)
+        # 1013: try again later
+        asyncio.create_task(connection.close(code=1013))
         
-    async def join_auction(self, user_id: str, auction_id: str, username: str):
-        """Add user to auction room"""
-        if auction_id not in self.auction_participants:
-            self.auction_participants[auction_id] = set()
+    def disconnect(self, connection: ClientConnection):
+        if self.connections.pop(connection.id, None) is None:
+            return
+        self._activity.pop(connection.id, None)
+        self.stats["dropped_frames"] += connection.dropped
+        self.stats["batched_messages"] += connection.batched
+        self.stats["compressed_frames"] += connection.compressed
+        connection.shutdown()
+        
+        self._exit_room(connection)
+        user_connections = self.user_connections.get(connection.user_id)
+        if user_connections is not None:
+            user_connections.discard(connection.id)
+            if not user_connections:
+                del self.user_connections[connection.user_id]
+                self.bus.unsubscribe(user_channel(connection.user_id))
             
-        self.auction_participants[auction_id].add(user_id)
-        self.user_auctions[user_id] = auction_id
-        
-        # Notify all participants in the auction
-        await self.broadcast_to_auction(auction_id, {
-            "type": "user_joined",
-            "user_id": user_id,
-            "username": username,
-            "timestamp": datetime.utcnow().isoformat(),
-            "participants_count": len(self.auction_participants[auction_id])
-        })
+        logger.info(f"User {connection.user_id} disconnected from WebSocket ({connection.id})")
+        
+    def touch(self, connection: ClientConnection):
+        """Record inbound activity; any message from the client proves it is alive"""
+        connection.last_seen = time.monotonic()
+        if connection.id in self._activity:
+            self._activity.move_to_end(connection.id)
         
-    async def leave_auction(self, user_id: str, username: str):
-        """Remove user from auction room"""
-        if user_id in self.user_auctions:
-            auction_id = self.user_auctions[user_id]
+    async def start(self):
+        await self.bus.start()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        await self.bus.stop()
+        
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL / 5)
+            try:
+                self._check_heartbeats(time.monotonic())
+            except Exception as e:
+                logger.error(f"Error in WebSocket heartbeat: {e}")
+        
+    def _check_heartbeats(self, now: float):
+        """Ping idle connections and reap the ones past the deadline.
+
+        Only connections at the idle end of the activity order are visited,
+        so a check costs nothing for the ones that are talking.
+        """
+        pinged = []
+        reaped = []
+        for connection_id in self._activity:
+            connection = self.connections[connection_id]
+            idle = now - connection.last_seen
+            if idle < WS_HEARTBEAT_INTERVAL:
+                break
+            if idle >= WS_HEARTBEAT_TIMEOUT:
+                reaped.append(connection)
+            elif now - connection.pinged_at >= WS_HEARTBEAT_INTERVAL:
+                connection.pinged_at = now
+                pinged.append(connection_id)
+                
+        # Delivering may drop a slow consumer, which edits _activity, so it waits until the walk is over
+        if pinged:
+            self.stats["heartbeat_pings"] += len(pinged)
+            self._deliver(pinged, Frame({"type": "ping", "server_time": datetime.utcnow().isoformat()}), False)
             
-            if auction_id in self.auction_participants:
-                self.auction_participants[auction_id].discard(user_id)
+        for connection in reaped:
+            self.stats["reaped_connections"] += 1
+            logger.info(f"Reaping unresponsive WebSocket of user {connection.user_id} ({connection.id})")
+            self.disconnect(connection)
+            # 1001: going away
+            asyncio.create_task(connection.close(code=1001))
+        
+    def _exit_room(self, connection: ClientConnection):
+        """Take a connection out of its room, announcing the user once their last tab has left"""
+        auction_id = self._leave_room(connection)
+        if auction_id is not None and connection.user_id not in self.auction_users.get(auction_id, ()):
+            self._record_presence(auction_id, connection.user_id, connection.username, joined=False)
+        
+    def _leave_room(self, connection: ClientConnection) -> Optional[str]:
+        auction_id = connection.auction_id
+        if auction_id is None:
+            return None
+        connection.auction_id = None
+        
+        room = self.auction_connections.get(auction_id)
+        if room is not None:
+            room.discard(connection.id)
+            if not room:
+                del self.auction_connections[auction_id]
+                # Keep sequencing for a while so a client coming back after a blip can still resume
+                self._idle_streams[auction_id] = time.monotonic()
+                self._expire_streams()
                 
-            del self.user_auctions[user_id]
+        users = self.auction_users.get(auction_id)
+        if users is not None:
+            users[connection.user_id] -= 1
+            if not users[connection.user_id]:
+                del users[connection.user_id]
+            if not users:
+                del self.auction_users[auction_id]
+        return auction_id
+        
+    def _expire_streams(self):
+        cutoff = time.monotonic() - WS_STREAM_RETENTION_SECONDS
+        while self._idle_streams:
+            auction_id, idle_since = next(iter(self._idle_streams.items()))
+            if idle_since > cutoff:
+                break
+            del self._idle_streams[auction_id]
+            self.streams.pop(auction_id, None)
+            self._room_totals.pop(auction_id, None)
+            self.bus.unsubscribe(auction_channel(auction_id))
+        
+    async def join_auction(self, connection: ClientConnection, auction_id: str, username: str,
+                           last_seq: Optional[int] = None, stream_id: Optional[str] = None):
+        """Add a connection to an auction room.
+
+        The connection is told the stream id and current sequence number.
+        A client that passes the last_seq (and stream) it saw before
+        reconnecting gets the events it missed replayed, or an
+        auction_snapshot if they are no longer buffered.
+        """
+        if connection.auction_id == auction_id:
+            return
+        self._exit_room(connection)
+        self._expire_streams()
+        
+        connection.auction_id = auction_id
+        connection.username = username
+        if auction_id not in self.auction_connections:
+            self.auction_connections[auction_id] = set()
+        if auction_id not in self.streams:
+            self.streams[auction_id] = AuctionStream()
+            self.bus.subscribe(auction_channel(auction_id))
+        self._idle_streams.pop(auction_id, None)
+        self.auction_connections[auction_id].add(connection.id)
+        users = self.auction_users.setdefault(auction_id, {})
+        users[connection.user_id] = users.get(connection.user_id, 0) + 1
+        if users[connection.user_id] == 1:
+            self._record_presence(auction_id, connection.user_id, username, joined=True)
+        
+        # Nothing is awaited between registering and replaying, so live events queue after the replay
+        stream = self.streams[auction_id]
+        self._deliver((connection.id,), Frame({
+            "type": "auction_joined",
+            "auction_id": auction_id,
+            "stream": stream.id,
+            "seq": stream.seq,
+            # The room's last known total; the presence_delta for this join follows within the interval
+            "participants_count": max(len(users), self._room_totals.get(auction_id, 0))
+        }), False)
+        if last_seq is not None:
+            missed = stream.since(last_seq) if stream_id == stream.id else None
+            if missed is None:
+                await self._send_snapshot(connection, auction_id, stream)
+            else:
+                for frame in missed:
+                    self._deliver((connection.id,), frame, False)
+                self.stats["replayed_events"] += len(missed)
+        
+    async def leave_auction(self, connection: ClientConnection, username: str):
+        """Remove a connection from its auction room"""
+        connection.username = connection.username or username
+        self._exit_room(connection)
+        
+    def _record_presence(self, auction_id: str, user_id: str, username: Optional[str], joined: bool):
+        pending = self._presence.get(auction_id)
+        if pending is None:
+            pending = self._presence[auction_id] = {}
+            asyncio.get_running_loop().call_later(WS_PRESENCE_INTERVAL_MS / 1000, self._schedule_presence_flush, auction_id)
+        previous = pending.get(user_id)
+        if previous is not None and previous[0] != joined:
+            del pending[user_id]  # joined and left again within one interval: nothing to tell
+        else:
+            pending[user_id] = (joined, username)
             
-            # Notify remaining participants
-            await self.broadcast_to_auction(auction_id, {
-                "type": "user_left",
-                "user_id": user_id,
-                "username": username,
-                "timestamp": datetime.utcnow().isoformat(),
-                "participants_count": len(self.auction_participants.get(auction_id, []))
-            })
+    def _schedule_presence_flush(self, auction_id: str):
+        task = asyncio.create_task(self.flush_presence(auction_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        
+    async def flush_presence(self, auction_id: str):
+        """Broadcast the presence changes collected for an auction as one presence_delta frame"""
+        pending = self._presence.pop(auction_id, None)
+        if not pending:
+            return
+        # Every worker reports its own participants and sends the total, so all clients see the same count
+        count, version = await self.bus.report_count(
+            auction_channel(auction_id), self.get_auction_participants_count(auction_id)
+        )
+        self._room_totals[auction_id] = count
+        message = {
+            "type": "presence_delta",
+            "auction_id": auction_id,
+            "participants_count": count,
+            "participants_version": version,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if count > WS_PRESENCE_COUNTS_ONLY_ABOVE:
+            joined = sum(1 for is_join, _ in pending.values() if is_join)
+            message.update({"counts_only": True, "joined_count": joined, "left_count": len(pending) - joined})
+        else:
+            message["joined"] = [{"user_id": user_id, "username": name} for user_id, (is_join, name) in pending.items() if is_join]
+            message["left"] = [{"user_id": user_id, "username": name} for user_id, (is_join, name) in pending.items() if not is_join]
+        self.stats["presence_frames"] += 1
+        await self.broadcast_to_auction(auction_id, message)
+    
+    async def _send_snapshot(self, connection: ClientConnection, auction_id: str, stream: AuctionStream):
+        state = await self.snapshot_provider(auction_id) if self.snapshot_provider else None
+        # Read after the await: events published meanwhile may be in the state, and they were
+        # already queued for this connection, so the snapshot must not point the client back before them
+        seq = stream.seq
+        self.stats["snapshots"] += 1
+        await self.send_to_connection(connection, {
+            "type": "auction_snapshot",
+            "auction_id": auction_id,
+            "stream": stream.id,
+            "seq": seq,
+            "state": state
+        })
     
     async def send_personal_message(self, message: dict, user_id: str):
-        """Send message to specific user"""
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error sending message to user {user_id}: {e}")
-                self.disconnect(user_id)
+        """Send message to every connection of a specific user, on any worker"""
+        await self.bus.publish(user_channel(user_id), Frame(message))
+        
+    async def send_to_connection(self, connection: ClientConnection, message: dict):
+        """Send message to one connection only, e.g. a reply to a request it made"""
+        if connection.id in self.connections:
+            self._deliver((connection.id,), Frame(message), False)
     
     async def broadcast_to_auction(self, auction_id: str, message: dict):
-        """Broadcast message to all participants in an auction"""
-        if auction_id not in self.auction_participants:
-            return
-            
-        participants = self.auction_participants[auction_id].copy()
-        disconnected_users = []
-        
-        for user_id in participants:
-            if user_id in self.active_connections:
-                try:
-                    await self.active_connections[user_id].send_text(json.dumps(message))
-                except Exception as e:
-                    logger.error(f"Error broadcasting to user {user_id}: {e}")
-                    disconnected_users.append(user_id)
+        """Broadcast message to all participants in an auction, on any worker"""
+        # Queue the same frame for every participant; it is encoded at most once per
+        # wire format, and each connection's writer task delivers it, so one slow socket holds up nobody
+        frame = Frame(message)
+        await self.bus.publish(auction_channel(auction_id), frame, message.get("type") in DROPPABLE_MESSAGE_TYPES)
+        
+    def _on_bus_message(self, channel: str, frame: Frame, droppable: bool):
+        """Deliver a published frame to the sockets this worker holds for the channel"""
+        kind, _, key = channel.partition(":")
+        if kind == "auction":
+            # Sequence on delivery. The numbers are this worker's own: with RedisBus a worker delivers
+            # its own publishes before the others' arrive, so workers can order a channel differently,
+            # and a client that rejoins on another worker sees a new stream id and gets a snapshot.
+            # Superseded frames such as timer ticks are neither numbered nor buffered.
+            stream = self.streams.get(key)
+            if stream is not None and not droppable:
+                frame = stream.append(frame)
+            connection_ids = self.auction_connections.get(key)
+        else:
+            connection_ids = self.user_connections.get(key)
+        if connection_ids:
+            self._deliver(connection_ids, frame, droppable)
+        
+    def _deliver(self, connection_ids, frame: Frame, droppable: bool):
+        slow_consumers = []
+        idle = []
+        for connection_id in connection_ids:
+            connection = self.connections.get(connection_id)
+            if connection is None:
+                continue
+            if not connection.enqueue(frame, droppable, wake=False):
+                slow_consumers.append(connection)
+            elif connection.idle:
+                idle.append(connection)
+        # Parked writers are woken together on the next loop pass, so the
+        # broadcasting caller is held only for the appends
+        if idle:
+            asyncio.get_running_loop().call_soon(_wake_writers, idle)
                     
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            self.disconnect(user_id)
+        for connection in slow_consumers:
+            self._drop_slow_consumer(connection)
     
     async def broadcast_bid_update(self, auction_id: str, bid_data: dict):
         """Broadcast new bid to all auction participants"""
@@ -127,11 +551,32 @@ class ConnectionManager:
         
     def get_auction_participants_count(self, auction_id: str) -> int:
         """Get number of participants in an auction"""
-        return len(self.auction_participants.get(auction_id, []))
+        return len(self.auction_users.get(auction_id, ()))
         
     def get_online_users_count(self) -> int:
         """Get total number of online users"""
-        return len(self.active_connections)
+        return len(self.user_connections)
+
+    def get_stats(self) -> dict:
+        """Connection and outbound queue metrics"""
+        depths = [len(c.queue) for c in self.connections.values()]
+        return {
+            **self.stats,
+            "dropped_frames": self.stats["dropped_frames"] + sum(c.dropped for c in self.connections.values()),
+            "batched_messages": self.stats["batched_messages"] + sum(c.batched for c in self.connections.values()),
+            "compressed_frames": self.stats["compressed_frames"] + sum(c.compressed for c in self.connections.values()),
+            "connections": len(self.connections),
+            "msgpack_connections": sum(1 for c in self.connections.values() if c.wire_format == "msgpack"),
+            "online_users": len(self.user_connections),
+            "auction_rooms": len(self.auction_connections),
+            "auction_streams": len(self.streams),
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_limit": WS_SEND_QUEUE_SIZE,
+            "slow_consumer_policy": WS_SLOW_CONSUMER_POLICY,
+            "heartbeat_timeout": WS_HEARTBEAT_TIMEOUT,
+            "bus": self.bus.get_stats()
+        }
 
 # Global connection manager instance
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager(broadcast_bus)
\ No newline at end of file
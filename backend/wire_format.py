@@ -0,0 +1,159 @@
+import json
+import logging
+import struct
+import zlib
+from datetime import datetime, timezone
+from enum import Enum
+from typing import List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# WebSocket subprotocol a client offers to receive MessagePack frames instead of JSON
+MSGPACK_SUBPROTOCOL = "sportx.msgpack.v1"
+
+# MessagePack frames replace the "type" key with "t" holding one of these codes.
+# Codes are part of the wire protocol: append new ones, never renumber.
+EVENT_CODES = {
+    "bid_update": 1,
+    "timer_update": 2,
+    "auction_status": 3,
+    "user_joined": 4,
+    "user_left": 5,
+    "timer_extended": 6,
+    "timer_warning": 7,
+    "timer_final_warning": 8,
+    "notification": 9,
+    "bid_result": 10,
+    "pong": 11,
+    "auction_joined": 12,
+    "auction_snapshot": 13,
+    "ping": 14,
+    "error": 15,
+    "presence_delta": 16,
+    "timer_sync": 17,
+    "auth_result": 18
+}
+
+# ISO 8601 string fields sent as epoch milliseconds in MessagePack frames
+TIMESTAMP_KEYS = {"timestamp", "new_end_time", "end_time", "start_time", "created_at", "server_time"}
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_message(message: dict) -> str:
+    """Encode an outbound message once; datetimes become ISO 8601 strings"""
+    if orjson is not None:
+        return orjson.dumps(message, default=_json_default).decode("utf-8")
+    return json.dumps(message, default=_json_default)
+
+def _epoch_ms(value: datetime) -> int:
+    # Naive datetimes in this app are UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+def _compact(value, key: Optional[str] = None):
+    if isinstance(value, dict):
+        return {k: _compact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v) for v in value]
+    if isinstance(value, datetime):
+        return _epoch_ms(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, str) and key in TIMESTAMP_KEYS:
+        try:
+            return _epoch_ms(datetime.fromisoformat(value))
+        except ValueError:
+            return value
+    return value
+
+def encode_msgpack(message: dict) -> bytes:
+    """Encode a message as a compact MessagePack frame"""
+    compact = _compact(message)
+    event = compact.pop("type", None)
+    if event is not None:
+        # Unknown event types keep their name so new events never break old clients
+        compact = {"t": EVENT_CODES.get(event, event), **compact}
+    return msgpack.packb(compact, use_bin_type=True)
+
+def deflate(text: str) -> bytes:
+    """Raw deflate, as decoded by the browser's DecompressionStream("deflate-raw")"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+class Frame:
+    """One outbound message, encoded lazily and at most once per wire format"""
+    __slots__ = ("_message", "_json", "_msgpack", "_deflated")
+
+    def __init__(self, message: Optional[dict] = None, json_text: Optional[str] = None):
+        self._message = message
+        self._json = json_text
+        self._msgpack: Optional[bytes] = None
+        self._deflated: Optional[bytes] = None
+
+    @classmethod
+    def from_json(cls, json_text: str) -> "Frame":
+        return cls(json_text=json_text)
+
+    @property
+    def message(self) -> dict:
+        if self._message is None:
+            self._message = orjson.loads(self._json) if orjson is not None else json.loads(self._json)
+        return self._message
+
+    def json(self) -> str:
+        if self._json is None:
+            self._json = encode_message(self._message)
+        return self._json
+
+    def msgpack(self) -> bytes:
+        if self._msgpack is None:
+            self._msgpack = encode_msgpack(self.message)
+        return self._msgpack
+
+    def deflated(self) -> bytes:
+        if self._deflated is None:
+            self._deflated = deflate(self.json())
+        return self._deflated
+
+    def with_fields(self, **fields) -> "Frame":
+        """Copy of this frame with extra top-level fields, reusing whatever is already encoded"""
+        if self._message is not None:
+            return Frame({**self._message, **fields})
+        # Splice the fields into the JSON object instead of decoding and re-encoding it
+        extra = encode_message(fields)[1:]
+        body = self._json.rstrip()[:-1]
+        return Frame(json_text=body + ("," if body.strip() != "{" else "") + extra)
+
+def batch_json(frames: List[Frame]) -> str:
+    """Several messages as one JSON array frame, reusing each message's cached encoding"""
+    return "[" + ",".join(frame.json() for frame in frames) + "]"
+
+def batch_msgpack(frames: List[Frame]) -> bytes:
+    """Several messages as one MessagePack array frame, reusing each message's cached encoding"""
+    count = len(frames)
+    if count < 16:
+        header = bytes((0x90 | count,))
+    elif count < 0x10000:
+        header = b"\xdc" + struct.pack(">H", count)
+    else:
+        header = b"\xdd" + struct.pack(">I", count)
+    return header + b"".join(frame.msgpack() for frame in frames)
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, ValidationError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Inbound frames larger than this are rejected before they are parsed
+WS_MAX_MESSAGE_BYTES = int(os.environ.get('WS_MAX_MESSAGE_BYTES', '16384'))
+
+class WebSocketSession:
+    """Per-socket state handed to every message handler"""
+    __slots__ = ("connection", "user", "expires_at")
+
+    def __init__(self, connection, user=None, expires_at: Optional[float] = None):
+        self.connection = connection
+        self.user = user
+        # The authenticating token's "exp", in epoch seconds; the socket outlives it otherwise
+        self.expires_at = expires_at
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+Handler = Callable[[WebSocketSession, BaseModel], Awaitable[None]]
+Reply = Callable[[WebSocketSession, dict], Awaitable[None]]
+
+class MessageTypeStats:
+    __slots__ = ("handled", "failed", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.handled = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "handled": self.handled,
+            "failed": self.failed,
+            "avg_ms": round(self.total_seconds / self.handled * 1000, 3) if self.handled else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3)
+        }
+
+class MessageRouter:
+    """Decodes inbound WebSocket frames, validates them and dispatches on their "type".
+
+    Handlers are registered per message type together with the pydantic
+    model their payload is validated against:
+
+        @ws_router.register("ping", PingMessage)
+        async def handle_ping(session, message): ...
+    """
+
+    def __init__(self, max_bytes: int = WS_MAX_MESSAGE_BYTES):
+        self.max_bytes = max_bytes
+        self.routes: Dict[str, Tuple[Type[BaseModel], Handler]] = {}
+        self.reply: Optional[Reply] = None
+        self.type_stats: Dict[str, MessageTypeStats] = {}
+        self.stats = {"oversize": 0, "malformed": 0, "unknown_type": 0, "invalid": 0}
+
+    def register(self, message_type: str, model: Type[BaseModel]) -> Callable[[Handler], Handler]:
+        """Decorator registering the handler of a message type"""
+        def decorator(handler: Handler) -> Handler:
+            if message_type in self.routes:
+                raise ValueError(f"WebSocket message type {message_type!r} is already registered")
+            self.routes[message_type] = (model, handler)
+            self.type_stats[message_type] = MessageTypeStats()
+            return handler
+        return decorator
+
+    async def dispatch(self, session: WebSocketSession, data: Union[str, bytes]):
+        """Handle one inbound frame; problems are answered with an error frame, never raised"""
+        # A str has at most as many characters as it has UTF-8 bytes, so this never rejects a valid frame
+        if len(data) > self.max_bytes:
+            self.stats["oversize"] += 1
+            await self._error(session, None, None, f"Message exceeds {self.max_bytes} bytes")
+            return
+
+        try:
+            payload = orjson.loads(data) if orjson is not None else json.loads(data)
+        except ValueError:
+            self.stats["malformed"] += 1
+            await self._error(session, None, None, "Message is not valid JSON")
+            return
+        if not isinstance(payload, dict):
+            self.stats["malformed"] += 1
+            await self._error(session, None, None, "Message must be a JSON object")
+            return
+
+        message_type = payload.get("type")
+        request_id = payload.get("request_id")
+        route = self.routes.get(message_type) if isinstance(message_type, str) else None
+        if route is None:
+            self.stats["unknown_type"] += 1
+            await self._error(session, message_type, request_id, f"Unknown message type: {message_type}")
+            return
+
+        model, handler = route
+        try:
+            message = model.model_validate(payload)
+        except ValidationError as e:
+            self.stats["invalid"] += 1
+            errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            await self._error(session, message_type, request_id, f"Invalid {message_type} message: {errors}")
+            return
+
+        stats = self.type_stats[message_type]
+        start = time.perf_counter()
+        try:
+            await handler(session, message)
+        except Exception as e:
+            stats.failed += 1
+            logger.error(f"Error handling WebSocket {message_type} message: {e}")
+            await self._error(session, message_type, request_id, "Internal error")
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.handled += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+
+    async def _error(self, session: WebSocketSession, message_type: Any, request_id: Any, error: str):
+        if self.reply is None:
+            return
+        await self.reply(session, {
+            "type": "error",
+            "message_type": message_type if isinstance(message_type, str) else None,
+            "request_id": request_id if isinstance(request_id, (str, int)) else None,
+            "error": error
+        })
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "max_message_bytes": self.max_bytes,
+            "types": {message_type: stats.as_dict() for message_type, stats in self.type_stats.items()}
+        }
+
+# Global WebSocket message router
+ws_router = MessageRouter()
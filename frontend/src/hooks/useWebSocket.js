@@ -1,14 +1,37 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 import toast from 'react-hot-toast';
+import { applyJoined, applySnapshot, isDuplicate } from '../lib/streamOffsets';
+
+// Some browsers have DecompressionStream but not 'deflate-raw'; asking for compressed frames there would lose every one
+const supportsDeflateRaw = () => {
+  try {
+    new DecompressionStream('deflate-raw');
+    return true;
+  } catch (error) {
+    return false;
+  }
+};
 
 const useWebSocket = (userId) => {
   const [isConnected, setIsConnected] = useState(false);
   const [participants, setParticipants] = useState([]);
+  const [participantsCount, setParticipantsCount] = useState(0);
   const [bidHistory, setBidHistory] = useState([]);
   const [timeRemaining, setTimeRemaining] = useState(180);
   const [auctionStatus, setAuctionStatus] = useState('active');
   const ws = useRef(null);
   const reconnectTimeout = useRef(null);
+  const pendingBids = useRef(new Map());
+  // Last stream id and sequence number seen per auction, so a rejoin can resume instead of refetching
+  const streams = useRef({});
+  const currentAuction = useRef(null);
+  // Version of the room total shown; totals from different workers can arrive out of order
+  const presenceVersion = useRef(0);
+  // Local countdown: the auction's deadline in this browser's clock, and how far ahead the server's clock is
+  const endAt = useRef(null);
+  const clockOffset = useRef(0);
+  // Compressed frames are inflated asynchronously; chaining keeps messages in arrival order
+  const receiveChain = useRef(Promise.resolve());
 
   const connect = useCallback(() => {
     if (!userId) return;
@@ -16,11 +39,17 @@ const useWebSocket = (userId) => {
     try {
       // Use the backend URL from environment
       const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
-      const wsUrl = backendUrl.replace('http', 'ws') + `/ws/${userId}`;
+      const token = localStorage.getItem('authToken');
+      const params = new URLSearchParams({ batch: '1' });
+      if (supportsDeflateRaw()) params.set('compress', '1');
+      const wsUrl = backendUrl.replace('http', 'ws') + `/ws/${userId}?${params}`;
       
       ws.current = new WebSocket(wsUrl);
+      ws.current.binaryType = 'arraybuffer';
 
       ws.current.onopen = () => {
+        // The token goes in the first message rather than the URL, which ends up in access logs
+        if (token) ws.current.send(JSON.stringify({ type: 'auth', token }));
         setIsConnected(true);
         console.log('WebSocket connected');
         
@@ -35,16 +64,26 @@ const useWebSocket = (userId) => {
       };
 
       ws.current.onmessage = (event) => {
-        try {
-          const message = JSON.parse(event.data);
-          handleWebSocketMessage(message);
-        } catch (error) {
-          console.error('Error parsing WebSocket message:', error);
-        }
+        receiveChain.current = receiveChain.current
+          .then(() => decodeFrame(event.data))
+          .then((data) => {
+            // Batched frames carry an array of messages
+            const messages = Array.isArray(data) ? data : [data];
+            messages.forEach((message) => {
+              if (!isDuplicate(streams.current, message, currentAuction.current)) handleWebSocketMessage(message);
+            });
+          })
+          .catch((error) => {
+            console.error('Error parsing WebSocket message:', error);
+          });
       };
 
       ws.current.onclose = (event) => {
         setIsConnected(false);
+
+        // Bids still awaiting a reply will never get one on this socket
+        pendingBids.current.forEach(({ reject }) => reject(new Error('WebSocket disconnected')));
+        pendingBids.current.clear();
         console.log('WebSocket disconnected:', event.code, event.reason);
         
         // Reconnect after 3 seconds if not intentionally closed
@@ -62,28 +101,83 @@ const useWebSocket = (userId) => {
     }
   }, [userId]);
 
+  // Server timestamps are naive UTC ISO strings
+  const parseServerTime = (value) => Date.parse(value.endsWith('Z') ? value : `${value}Z`);
+
+  const setDeadline = (serverEndTime) => {
+    endAt.current = parseServerTime(serverEndTime) - clockOffset.current;
+    setTimeRemaining(Math.max(0, Math.ceil((endAt.current - Date.now()) / 1000)));
+  };
+
+  // Text frames are JSON; binary frames are raw-deflated JSON
+  const decodeFrame = async (data) => {
+    if (typeof data === 'string') return JSON.parse(data);
+    const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate-raw'));
+    return JSON.parse(await new Response(stream).text());
+  };
+
   const handleWebSocketMessage = useCallback((message) => {
     switch (message.type) {
+      case 'auction_joined':
+        applyJoined(streams.current, message);
+        presenceVersion.current = 0;
+        setParticipantsCount(message.participants_count);
+        break;
+
+      case 'auction_snapshot': {
+        applySnapshot(streams.current, message);
+        const state = message.state;
+        if (state) {
+          setBidHistory(state.bids || []);
+          setAuctionStatus(state.is_active ? 'active' : 'ended');
+          if (state.end_time) {
+            setDeadline(state.end_time);
+          }
+        }
+        break;
+      }
+
+
       case 'bid_update':
         setBidHistory(prev => [message.bid, ...prev.slice(0, 9)]);
         toast.success(`${message.bid.username} bid $${message.bid.amount.toLocaleString()}! 🎯`);
         break;
 
-      case 'user_joined':
-        setParticipants(prev => [...prev.filter(p => p.id !== message.user_id), {
-          id: message.user_id,
-          username: message.username,
+      case 'presence_delta': {
+        // Joins and leaves are aggregated per interval; big rooms only send counts
+        const version = message.participants_version || 0;
+        if (version >= presenceVersion.current) {
+          presenceVersion.current = version;
+          setParticipantsCount(message.participants_count);
+        }
+        if (message.counts_only) break;
+        const left = new Set(message.left.map(p => p.user_id));
+        const joined = message.joined.map(p => ({
+          id: p.user_id,
+          username: p.username,
           isOnline: true,
           joinedAt: new Date(message.timestamp)
-        }]);
-        toast(`${message.username} joined the auction! 👋`, { icon: '🏏' });
+        }));
+        const joinedIds = new Set(joined.map(p => p.id));
+        setParticipants(prev => [
+          ...prev.filter(p => !left.has(p.id) && !joinedIds.has(p.id)),
+          ...joined
+        ]);
+        if (joined.length === 1) {
+          toast(`${joined[0].username} joined the auction! 👋`, { icon: '🏏' });
+        } else if (joined.length > 1) {
+          toast(`${joined.length} people joined the auction! 👋`, { icon: '🏏' });
+        }
         break;
+      }
 
-      case 'user_left':
-        setParticipants(prev => prev.filter(p => p.id !== message.user_id));
+      case 'timer_sync':
+        clockOffset.current = parseServerTime(message.server_time) - Date.now();
+        setDeadline(message.end_time);
         break;
 
       case 'timer_update':
+        // Sent only by servers running with legacy timer ticks
         setTimeRemaining(message.time_remaining);
         break;
 
@@ -96,6 +190,7 @@ const useWebSocket = (userId) => {
         break;
 
       case 'timer_extended':
+        setDeadline(message.new_end_time);
         toast.success(`Timer extended by ${message.additional_seconds} seconds!`, { icon: '⏰' });
         break;
 
@@ -129,10 +224,53 @@ const useWebSocket = (userId) => {
         }
         break;
 
+      case 'bid_result': {
+        const pending = pendingBids.current.get(message.request_id);
+        if (pending) {
+          pendingBids.current.delete(message.request_id);
+          if (message.success) {
+            pending.resolve(message.bid);
+          } else {
+            pending.reject(new Error(message.error));
+          }
+        }
+        // A socket that outlived its token picks up the one from a newer login, if there is one
+        if (message.status === 401) {
+          const token = localStorage.getItem('authToken');
+          if (token && ws.current?.readyState === WebSocket.OPEN) {
+            ws.current.send(JSON.stringify({ type: 'auth', token }));
+          }
+        }
+        break;
+      }
+
       case 'pong':
         // Handle ping response
         break;
 
+      case 'auth_result':
+        if (!message.success) console.warn('WebSocket authentication failed; bids need a fresh login');
+        break;
+
+      case 'error': {
+        // The server rejected a message before handling it, e.g. a malformed bid
+        const pending = pendingBids.current.get(message.request_id);
+        if (pending) {
+          pendingBids.current.delete(message.request_id);
+          pending.reject(new Error(message.error));
+        } else {
+          console.warn('WebSocket message rejected:', message.error);
+        }
+        break;
+      }
+
+      case 'ping':
+        // Server heartbeat; answering keeps an otherwise quiet connection from being reaped
+        if (ws.current?.readyState === WebSocket.OPEN) {
+          ws.current.send(JSON.stringify({ type: 'pong' }));
+        }
+        break;
+
       default:
         console.log('Unknown WebSocket message type:', message.type);
     }
@@ -149,16 +287,20 @@ const useWebSocket = (userId) => {
 
   const joinAuction = useCallback((auctionId, username) => {
     if (ws.current?.readyState === WebSocket.OPEN) {
+      const seen = streams.current[auctionId];
+      currentAuction.current = auctionId;
       ws.current.send(JSON.stringify({
         type: 'join_auction',
         auction_id: auctionId,
-        username: username
+        username: username,
+        ...(seen && { last_seq: seen.seq, stream: seen.stream })
       }));
     }
   }, []);
 
   const leaveAuction = useCallback((username) => {
     if (ws.current?.readyState === WebSocket.OPEN) {
+      currentAuction.current = null;
       ws.current.send(JSON.stringify({
         type: 'leave_auction',
         username: username
@@ -166,19 +308,48 @@ const useWebSocket = (userId) => {
     }
   }, []);
 
+  const placeBid = useCallback((auctionId, amount) => {
+    return new Promise((resolve, reject) => {
+      if (ws.current?.readyState !== WebSocket.OPEN) {
+        reject(new Error('WebSocket is not connected'));
+        return;
+      }
+      const requestId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+      pendingBids.current.set(requestId, { resolve, reject });
+      ws.current.send(JSON.stringify({
+        type: 'place_bid',
+        request_id: requestId,
+        auction_id: auctionId,
+        amount: amount
+      }));
+    });
+  }, []);
+
   useEffect(() => {
     connect();
     return () => disconnect();
   }, [connect, disconnect]);
 
+  // Count down locally between timer_sync frames
+  useEffect(() => {
+    const interval = setInterval(() => {
+      if (endAt.current !== null) {
+        setTimeRemaining(Math.max(0, Math.ceil((endAt.current - Date.now()) / 1000)));
+      }
+    }, 250);
+    return () => clearInterval(interval);
+  }, []);
+
   return {
     isConnected,
     participants,
+    participantsCount,
     bidHistory,
     timeRemaining,
     auctionStatus,
     joinAuction,
     leaveAuction,
+    placeBid,
     disconnect
   };
 };
@@ -0,0 +1,30 @@
+// Last stream id and sequence number applied per auction, so a rejoin can resume instead of refetching
+
+// Control frames carry the stream head, not an event; only their handlers may move the offset
+const CONTROL_FRAMES = new Set(['auction_joined', 'auction_snapshot']);
+
+// Tracks sequenced auction events; replayed events already applied are skipped
+export function isDuplicate(offsets, message, currentAuctionId) {
+  if (CONTROL_FRAMES.has(message.type)) return false;
+  if (message.seq === undefined || !message.stream) return false;
+  const auctionId = message.auction_id || currentAuctionId;
+  const seen = offsets[auctionId];
+  if (seen && seen.stream === message.stream && message.seq <= seen.seq) return true;
+  offsets[auctionId] = { stream: message.stream, seq: message.seq };
+  return false;
+}
+
+// Same stream: keep our offset so replayed events apply; a new stream comes with a snapshot
+export function applyJoined(offsets, message) {
+  const seen = offsets[message.auction_id];
+  if (!seen || seen.stream !== message.stream) {
+    offsets[message.auction_id] = { stream: message.stream, seq: message.seq };
+  }
+}
+
+// A snapshot replaces everything before its sequence number; on the same stream the offset never moves back
+export function applySnapshot(offsets, message) {
+  const seen = offsets[message.auction_id];
+  if (seen && seen.stream === message.stream && seen.seq >= message.seq) return;
+  offsets[message.auction_id] = { stream: message.stream, seq: message.seq };
+}
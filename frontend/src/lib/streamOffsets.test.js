@@ -0,0 +1,66 @@
+import { applyJoined, applySnapshot, isDuplicate } from './streamOffsets';
+
+// Feeds messages through the same path as useWebSocket's onmessage and returns the applied ones
+const receive = (offsets, messages, currentAuctionId = 'A') => {
+  const applied = [];
+  messages.forEach((message) => {
+    if (isDuplicate(offsets, message, currentAuctionId)) return;
+    if (message.type === 'auction_joined') applyJoined(offsets, message);
+    if (message.type === 'auction_snapshot') applySnapshot(offsets, message);
+    applied.push(message);
+  });
+  return applied;
+};
+
+const event = (seq, stream = 's1') => ({ type: 'bid_update', auction_id: 'A', stream, seq });
+
+describe('stream offsets', () => {
+  it('applies the events replayed after a rejoin with last_seq', () => {
+    const offsets = { A: { stream: 's1', seq: 40 } };
+    const applied = receive(offsets, [
+      { type: 'auction_joined', auction_id: 'A', stream: 's1', seq: 50 },
+      event(41),
+      event(45),
+      event(50)
+    ]);
+    expect(applied.map((m) => m.seq)).toEqual([50, 41, 45, 50]);
+    expect(offsets.A).toEqual({ stream: 's1', seq: 50 });
+  });
+
+  it('skips events that were already applied', () => {
+    const offsets = { A: { stream: 's1', seq: 40 } };
+    const applied = receive(offsets, [event(39), event(40), event(41), event(41)]);
+    expect(applied.map((m) => m.seq)).toEqual([41]);
+  });
+
+  it('takes the offset of a snapshot on a new stream', () => {
+    const offsets = { A: { stream: 's1', seq: 40 } };
+    const applied = receive(offsets, [
+      { type: 'auction_joined', auction_id: 'A', stream: 's2', seq: 7 },
+      { type: 'auction_snapshot', auction_id: 'A', stream: 's2', seq: 7 },
+      event(7, 's2'),
+      event(8, 's2')
+    ]);
+    expect(applied.map((m) => m.type)).toEqual(['auction_joined', 'auction_snapshot', 'bid_update']);
+    expect(offsets.A).toEqual({ stream: 's2', seq: 8 });
+  });
+
+  it('never moves the offset back for a snapshot older than applied events', () => {
+    const offsets = { A: { stream: 's1', seq: 3 } };
+    const applied = receive(offsets, [
+      { type: 'auction_joined', auction_id: 'A', stream: 's2', seq: 10 },
+      event(11, 's2'),
+      { type: 'auction_snapshot', auction_id: 'A', stream: 's2', seq: 10 },
+      event(11, 's2'),
+      event(12, 's2')
+    ]);
+    expect(applied.map((m) => m.seq)).toEqual([10, 11, 10, 12]);
+    expect(offsets.A).toEqual({ stream: 's2', seq: 12 });
+  });
+
+  it('uses the current auction for events without an auction_id', () => {
+    const offsets = {};
+    receive(offsets, [{ type: 'presence_delta', stream: 's1', seq: 3 }]);
+    expect(offsets.A).toEqual({ stream: 's1', seq: 3 });
+  });
+});
@@ -0,0 +1,21 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from auction_timer import AuctionTimer
+
+def test_local_countdowns_first_wake_at_the_next_warning_mark():
+    async def run():
+        timer = AuctionTimer(legacy_ticks=False)
+        start_time = datetime.utcnow()
+        for auction_id, seconds in (("long", 100), ("short", 20), ("on_mark", 30)):
+            timer._track(auction_id, start_time, start_time + timedelta(seconds=seconds))
+
+        wakes = {auction_id: wake_at for wake_at, _, auction_id, _ in timer._heap}
+        deadlines = {auction_id: data["deadline"] for auction_id, data in timer.auction_data.items()}
+        assert abs(wakes["long"] - (deadlines["long"] - 30)) < 1e-6
+        assert abs(wakes["short"] - (deadlines["short"] - 10)) < 1e-6
+        # Already on a mark, so its warning goes out straight away
+        assert deadlines["on_mark"] - wakes["on_mark"] > 29
+        await timer.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,138 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from auction_timer import AuctionTimer
+from bid_book import BidBookManager, bid_books
+
+def make_bid(auction_id, user_id, amount):
+    return {
+        "id": str(uuid.uuid4()),
+        "auction_id": auction_id,
+        "user_id": user_id,
+        "username": user_id,
+        "amount": amount,
+        "timestamp": datetime.utcnow()
+    }
+
+def make_auction(auction_id, current_bid=100):
+    return {"id": auction_id, "current_bid": current_bid, "min_increment": 10, "is_active": True, "end_time": None}
+
+class FlakyCollection:
+    """Proxies a collection, failing the first `failures` update_one calls"""
+
+    def __init__(self, collection, failures):
+        self.collection = collection
+        self.failures = failures
+
+    async def update_one(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        return await self.collection.update_one(*args, **kwargs)
+
+class FlakyDb:
+    def __init__(self, db, failures):
+        self.bids = FlakyCollection(db.bids, failures)
+        self.auctions = db.auctions
+
+def test_failed_background_write_is_retried_until_it_lands():
+    async def run():
+        db = AsyncMongoMockClient()["book_test"]
+        await db.auctions.insert_one(make_auction("A"))
+        books = BidBookManager(mode="book")
+        books.create(make_auction("A"))
+        bid = make_bid("A", "u1", 150)
+
+        await books.accept("A", bid, FlakyDb(db, failures=2))
+        await books.close("A")
+
+        assert await db.bids.count_documents({"id": bid["id"]}) == 1
+        auction = await db.auctions.find_one({"id": "A"})
+        assert (auction["current_bid"], auction["winning_bid_id"]) == (150, bid["id"])
+
+    asyncio.run(run())
+
+def test_settlement_takes_the_winner_from_a_live_book():
+    async def run():
+        db = AsyncMongoMockClient()["book_test"]
+        await db.auctions.insert_one({**make_auction("A"), "tournament_id": "T", "player_id": "p1"})
+        # Accepted and broadcast, but its Mongo write has not landed
+        bid = make_bid("A", "u2", 150)
+        bid_books.create(make_auction("A")).accept(bid)
+
+        await AuctionTimer()._settle_batch(["A"], db)
+
+        auction = await db.auctions.find_one({"id": "A"})
+        assert (auction["is_active"], auction["winner_id"], auction["final_price"]) == (False, "u2", 150)
+        assert "A" not in bid_books.books
+
+    asyncio.run(run())
+
+class GatedCollection:
+    """Proxies a collection, holding update_one until the gate opens"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.gate = asyncio.Event()
+        self.calls = 0
+
+    async def update_one(self, *args, **kwargs):
+        self.calls += 1
+        await self.gate.wait()
+        return await self.collection.update_one(*args, **kwargs)
+
+def test_book_mode_extension_does_not_wait_for_the_end_time_write(monkeypatch):
+    monkeypatch.setattr(bid_books, "mode", "book")
+
+    async def run():
+        db = AsyncMongoMockClient()["book_test"]
+        start_time = datetime.utcnow()
+        await db.auctions.insert_one({**make_auction("A"), "end_time": start_time + timedelta(seconds=10)})
+        auctions = GatedCollection(db.auctions)
+        gated = type("GatedDb", (), {"auctions": auctions})()
+        timer = AuctionTimer()
+        timer._track("A", start_time, start_time + timedelta(seconds=10))
+
+        await asyncio.wait_for(timer.extend_auction_timer("A", 30, gated), timeout=1)
+        await asyncio.wait_for(timer.extend_auction_timer("A", 30, gated), timeout=1)
+        end_time = timer.auction_data["A"]["end_time"]
+        assert len(timer._end_time_writes) == 1
+
+        # The second extension is written by the same task once the first write lands
+        auctions.gate.set()
+        await asyncio.gather(*timer._tasks)
+        auction = await db.auctions.find_one({"id": "A"})
+        assert auction["end_time"].replace(microsecond=0) == end_time.replace(microsecond=0)
+        assert auctions.calls == 2 and not timer._end_time_writes
+
+    asyncio.run(run())
+
+class IdleLeases:
+    """Lease stand-in that acquires nothing on its own"""
+
+    shards = 4
+    on_acquired = None
+
+    async def start(self, db):
+        pass
+
+    def owns(self, auction_id):
+        return True
+
+def test_takeovers_during_startup_recovery_are_not_missed():
+    async def run():
+        timer = AuctionTimer(leases=IdleLeases())
+        hooked = []
+
+        async def recover(db, shards=None):
+            # A renewal landing mid-scan must already reach the timer
+            hooked.append(timer.leases.on_acquired is not None)
+
+        timer.recover = recover
+        await timer.start(AsyncMongoMockClient()["book_test"])
+        assert hooked == [True]
+
+    asyncio.run(run())
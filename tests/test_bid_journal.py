@@ -0,0 +1,160 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import bid_journal
+from bid_book import BidBookManager, BidRejected, bid_books
+from bid_journal import BidJournal, _encode_record
+
+def make_bid(auction_id, user_id, amount):
+    return {
+        "id": str(uuid.uuid4()),
+        "auction_id": auction_id,
+        "user_id": user_id,
+        "username": user_id,
+        "amount": amount,
+        "timestamp": datetime.utcnow()
+    }
+
+def make_auction(auction_id, current_bid=100):
+    return {"id": auction_id, "current_bid": current_bid, "min_increment": 10, "is_active": True, "end_time": None}
+
+def test_replay_skips_torn_last_record(tmp_path):
+    async def run():
+        db = AsyncMongoMockClient()["journal_test"]
+        await db.auctions.insert_one(make_auction("A"))
+        first, second, torn = make_bid("A", "u1", 110), make_bid("A", "u2", 120), make_bid("A", "u1", 130)
+
+        # A crash mid-write leaves the last record without its end
+        record = _encode_record("A", torn)
+        segment = tmp_path / "segment-000000000001.log"
+        segment.write_bytes(_encode_record("A", first) + _encode_record("A", second) + record[:len(record) // 2])
+
+        journal = BidJournal(directory=str(tmp_path))
+        await journal.start(db)
+        await journal.stop()
+
+        assert journal.stats["replayed"] == 2
+        assert {bid["id"] for bid in await db.bids.find({}).to_list(None)} == {first["id"], second["id"]}
+        auction = await db.auctions.find_one({"id": "A"})
+        assert (auction["current_bid"], auction["winning_bid_id"]) == (120, second["id"])
+        assert not segment.exists()
+
+    asyncio.run(run())
+
+def test_replay_is_idempotent(tmp_path):
+    async def run():
+        db = AsyncMongoMockClient()["journal_test"]
+        await db.auctions.insert_one(make_auction("A"))
+        bid = make_bid("A", "u1", 110)
+        await db.bids.insert_one(dict(bid))
+
+        # The bid reached Mongo but the process died before the segment was deleted
+        (tmp_path / "segment-000000000001.log").write_bytes(_encode_record("A", bid))
+
+        journal = BidJournal(directory=str(tmp_path))
+        await journal.start(db)
+        await journal.stop()
+
+        assert await db.bids.count_documents({"id": bid["id"]}) == 1
+
+    asyncio.run(run())
+
+class FailingJournal:
+    async def append(self, auction_id, bid):
+        raise OSError("disk full")
+
+def test_failed_append_restores_book():
+    async def run():
+        db = AsyncMongoMockClient()["journal_test"]
+        books = BidBookManager(mode="book")
+        books.create(make_auction("A"))
+        books.journal = FailingJournal()
+
+        with pytest.raises(BidRejected) as rejected:
+            await books.accept("A", make_bid("A", "u1", 200), db)
+        assert rejected.value.status_code == 503
+
+        book = books.books["A"]
+        assert (book.current_bid, book.highest_bidder_id, book.winning_bid_id) == (100, None, None)
+        assert not book.recent_bids
+
+        # A bid valid against the durable price is not held to the failed one
+        books.journal = None
+        state = await books.accept("A", make_bid("A", "u2", 150), db)
+        assert state["current_bid"] == 150
+
+    asyncio.run(run())
+
+def test_reverting_a_failed_group_commit_unwinds_to_the_durable_leader():
+    async def run():
+        books = BidBookManager(mode="book")
+        books.create(make_auction("A"))
+        book = books.books["A"]
+
+        durable = make_bid("A", "u1", 110)
+        book.accept(durable)
+        first, second = make_bid("A", "u2", 120), make_bid("A", "u3", 130)
+        before_first = book.leader()
+        book.accept(first)
+        before_second = book.leader()
+        book.accept(second)
+
+        # Both bids were in the same failed commit
+        book.revert(first, before_first)
+        book.revert(second, before_second)
+        assert book.leader() == (110, "u1", durable["id"])
+
+    asyncio.run(run())
+
+def test_failed_sync_leaves_no_bytes_in_the_segment(tmp_path, monkeypatch):
+    async def run():
+        db = AsyncMongoMockClient()["journal_test"]
+        await db.auctions.insert_one(make_auction("A"))
+        journal = BidJournal(directory=str(tmp_path), commit_interval_ms=60000)
+        await journal.start(db)
+        segment = journal._segment_path(journal._segment_id)
+
+        # The write reaches the file, then fsync fails once
+        fsync = bid_journal.os.fsync
+        failures = [OSError("I/O error")]
+        def failing_fsync(fd):
+            if failures:
+                raise failures.pop()
+            fsync(fd)
+        monkeypatch.setattr(bid_journal.os, "fsync", failing_fsync)
+
+        rejected = asyncio.create_task(journal.append("A", make_bid("A", "u1", 110)))
+        await asyncio.sleep(0)
+        with pytest.raises(OSError):
+            await journal._commit()
+        with pytest.raises(OSError):
+            await rejected
+        assert segment.read_bytes() == b""
+
+        accepted = make_bid("A", "u2", 120)
+        appended = asyncio.create_task(journal.append("A", accepted))
+        await asyncio.sleep(0)
+        await journal._commit()
+        await appended
+        assert segment.read_bytes() == _encode_record("A", accepted)
+
+        await journal.stop()
+
+    asyncio.run(run())
+
+def test_stop_detaches_the_journal_from_the_bid_books(tmp_path):
+    async def run():
+        journal = BidJournal(directory=str(tmp_path))
+        await journal.start(AsyncMongoMockClient()["journal_test"])
+        bid_books.journal = journal
+
+        await journal.stop()
+        assert bid_books.journal is None
+        with pytest.raises(RuntimeError):
+            await journal.append("A", make_bid("A", "u1", 110))
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import fakeredis
+
+import websocket_manager
+from broadcast_bus import RedisBus
+from websocket_manager import ConnectionManager
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.scope = {}
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code=1000):
+        pass
+
+def workers(count):
+    """RedisBus instances of separate workers sharing one Redis, without the pub/sub reader"""
+    server = fakeredis.FakeServer()
+    buses = [RedisBus() for _ in range(count)]
+    for bus in buses:
+        bus._redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    return buses
+
+def test_report_count_totals_every_worker():
+    async def run():
+        first, second = workers(2)
+        assert await first.report_count("auction:A", 3) == (3, 1)
+        assert await second.report_count("auction:A", 2) == (5, 2)
+        # A worker whose room emptied drops out of the total
+        assert await first.report_count("auction:A", 0) == (2, 3)
+
+        await second.stop()
+        assert await first.report_count("auction:A", 1) == (1, 4)
+
+    asyncio.run(run())
+
+def test_presence_counts_agree_across_workers(monkeypatch):
+    monkeypatch.setattr(websocket_manager, "WS_PRESENCE_INTERVAL_MS", 10)
+
+    async def run():
+        managers = [ConnectionManager(bus) for bus in workers(2)]
+        sockets = []
+        for i, manager in enumerate(managers):
+            for j in range(i + 1):
+                websocket = RecordingWebSocket()
+                sockets.append(websocket)
+                connection = await manager.connect(websocket, f"user-{i}-{j}")
+                await manager.join_auction(connection, "A", f"user-{i}-{j}")
+        await asyncio.sleep(0.05)
+
+        # Each worker only delivers to its own sockets, but both send the room's total
+        deltas = [[m for m in websocket.sent if m["type"] == "presence_delta"][-1] for websocket in sockets]
+        latest = max(deltas, key=lambda m: m["participants_version"])
+        assert latest["participants_count"] == 3
+
+    asyncio.run(run())
@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from bid_book import BidRejected
+from budget_ledger import BudgetLedgerManager, TournamentLedger
+
+class FailingTournaments:
+    """bulk_write that applies nothing and reports the given op indexes as failed"""
+
+    def __init__(self, failed=None):
+        self.failed = failed
+
+    async def bulk_write(self, updates, ordered=True):
+        if self.failed is None:
+            raise ConnectionError("connection reset")
+        raise BulkWriteError({"writeErrors": [{"index": i, "errmsg": "failed"} for i in self.failed]})
+
+class FakeDb:
+    def __init__(self, tournaments):
+        self.tournaments = tournaments
+
+def make_manager():
+    manager = BudgetLedgerManager()
+    ledger = TournamentLedger("T", {"Batsman": 5})
+    for user_id in ("u1", "u2"):
+        ledger.add_participant({"user_id": user_id, "current_budget": 1000}, {})
+    manager.ledgers["T"] = ledger
+    for auction_id in ("A", "B"):
+        manager.auction_meta[auction_id] = ("T", "Batsman")
+    ledger.commit(ledger.hold("A", "u1", 300, "Batsman"))
+    ledger.commit(ledger.hold("B", "u2", 200, "Batsman"))
+    return manager, ledger
+
+def auction(auction_id):
+    return {"id": auction_id, "tournament_id": "T", "player_id": f"player-{auction_id}"}
+
+def test_partial_bulk_write_failure_charges_only_applied_winners():
+    manager, ledger = make_manager()
+    asyncio.run(manager.settle_many(
+        [(auction("A"), "u1", 300), (auction("B"), "u2", 200)],
+        FakeDb(FailingTournaments(failed=[1]))
+    ))
+
+    assert not ledger.reservations
+    u1, u2 = ledger.accounts["u1"], ledger.accounts["u2"]
+    assert (u1.current_budget, u1.reserved, u1.squad_counts) == (700, 0, {"Batsman": 1})
+    assert (u2.current_budget, u2.reserved, u2.squad_counts) == (1000, 0, {})
+
+def test_failed_bulk_write_still_releases_reservations():
+    manager, ledger = make_manager()
+    asyncio.run(manager.settle_many(
+        [(auction("A"), "u1", 300), (auction("B"), "u2", 200)],
+        FakeDb(FailingTournaments())
+    ))
+
+    assert not ledger.reservations
+    for account in ledger.accounts.values():
+        assert (account.current_budget, account.reserved, account.leading_counts) == (1000, 0, {"Batsman": 0})
+
+def test_loading_a_ledger_reserves_the_funds_of_current_leaders():
+    async def run():
+        db = AsyncMongoMockClient()["ledger_test"]
+        await db.tournaments.insert_one({
+            "id": "T",
+            "squad_composition": {"batsmen": 1},
+            "participants": [{"user_id": "u1", "current_budget": 1000, "squad": []}]
+        })
+        await db.players.insert_many([{"id": "p1", "position": "Batsman"}, {"id": "p2", "position": "Batsman"}])
+        await db.auctions.insert_many([
+            {"id": "A", "tournament_id": "T", "player_id": "p1", "current_bid": 800, "highest_bidder_id": "u1", "is_active": True},
+            {"id": "B", "tournament_id": "T", "player_id": "p2", "current_bid": 100, "highest_bidder_id": None, "is_active": True}
+        ])
+
+        manager = BudgetLedgerManager()
+        ledger, position = await manager.for_auction("B", db)
+        assert position == "Batsman"
+        assert ledger.reservations == {"A": ("u1", 800, "Batsman")}
+        assert ledger.spendable("B", "u1") == 200
+        # Raising their own bid on A reuses its reservation
+        assert ledger.spendable("A", "u1") == 1000
+        # Leading on A takes the only batsman slot
+        with pytest.raises(BidRejected):
+            ledger.hold("B", "u1", 150, "Batsman")
+
+    asyncio.run(run())
+
+def test_commit_after_settlement_releases_its_hold():
+    manager, ledger = make_manager()
+    late = ledger.hold("A", "u2", 400, "Batsman")
+    ledger.settle("A", "u1", 300, "Batsman")
+
+    ledger.commit(late)
+    assert "A" not in ledger.reservations
+    assert ledger.accounts["u2"].reserved == 200
+
+async def shared_tournament(db):
+    await db.tournaments.insert_one({
+        "id": "T",
+        "squad_composition": {"batsmen": 2},
+        "participants": [
+            {"user_id": "u1", "current_budget": 1000, "squad": []},
+            {"user_id": "u2", "current_budget": 1000, "squad": []}
+        ]
+    })
+    await db.players.insert_many([{"id": f"p{i}", "position": "Batsman"} for i in range(3)])
+    await db.auctions.insert_many([
+        {"id": auction_id, "tournament_id": "T", "player_id": f"p{i}", "current_bid": 100, "is_active": True}
+        for i, auction_id in enumerate("ABC")
+    ])
+    await db.budget_reservations.create_index("auction_id", unique=True)
+
+async def reserved(db):
+    tournament = await db.tournaments.find_one({"id": "T"})
+    return {p["user_id"]: p.get("reserved", 0) for p in tournament["participants"]}
+
+def test_shared_ledger_checks_budget_across_processes():
+    async def run():
+        db = AsyncMongoMockClient()["ledger_test"]
+        await shared_tournament(db)
+        # Two processes, each with its own manager, accepting bids for the same tournament
+        first, second = BudgetLedgerManager(shared=True), BudgetLedgerManager(shared=True)
+
+        await first.commit(await first.hold("A", "u1", 600, db), db)
+        with pytest.raises(BidRejected) as rejected:
+            await second.hold("B", "u1", 500, db)
+        assert str(rejected.value) == "Insufficient budget: $400 available"
+
+        # Raising their own leading bid only reserves the increase
+        await second.commit(await second.hold("A", "u1", 900, db), db)
+        assert await reserved(db) == {"u1": 900, "u2": 0}
+
+        # Being outbid releases the funds
+        await first.commit(await first.hold("A", "u2", 950, db), db)
+        assert await reserved(db) == {"u1": 0, "u2": 950}
+        assert await second.spendable("B", "u1", db) == 1000
+
+    asyncio.run(run())
+
+def test_shared_ledger_releases_commits_that_lose_to_settlement():
+    async def run():
+        db = AsyncMongoMockClient()["ledger_test"]
+        await shared_tournament(db)
+        manager = BudgetLedgerManager(shared=True)
+
+        await manager.commit(await manager.hold("A", "u1", 300, db), db)
+        late = await manager.hold("A", "u2", 400, db)
+        await manager.settle_many([({"id": "A", "tournament_id": "T", "player_id": "p0"}, "u1", 300)], db)
+        await manager.commit(late, db)
+
+        assert await reserved(db) == {"u1": 0, "u2": 0}
+        with pytest.raises(BidRejected):
+            await manager.hold("A", "u2", 500, db)
+
+    asyncio.run(run())
+
+def test_shared_ledger_checks_squad_slots():
+    async def run():
+        db = AsyncMongoMockClient()["ledger_test"]
+        await shared_tournament(db)
+        manager = BudgetLedgerManager(shared=True)
+
+        await manager.commit(await manager.hold("A", "u1", 200, db), db)
+        await manager.commit(await manager.hold("B", "u1", 200, db), db)
+        with pytest.raises(BidRejected) as rejected:
+            await manager.hold("C", "u1", 200, db)
+        assert str(rejected.value) == "Squad is full for Batsman"
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyCache, IdempotencyCacheFull
+
+def test_full_cache_evicts_completed_entries_behind_in_flight_ones():
+    async def run():
+        cache = IdempotencyCache(max_entries=3)
+        cache.reserve("u", "in-flight")
+        cache.reserve("u", "done-1")
+        cache.reserve("u", "done-2")
+        cache.complete(("u", "done-1"), "bid-1")
+        cache.complete(("u", "done-2"), "bid-2")
+
+        cache.reserve("u", "new")
+        assert list(cache._entries) == [("u", "in-flight"), ("u", "done-2"), ("u", "new")]
+        assert cache.stats["evicted"] == 1
+
+    asyncio.run(run())
+
+def test_cache_full_of_in_flight_requests_refuses_new_keys():
+    async def run():
+        cache = IdempotencyCache(max_entries=2)
+        cache.reserve("u", "a")
+        cache.reserve("u", "b")
+
+        with pytest.raises(IdempotencyCacheFull):
+            cache.reserve("u", "c")
+        assert len(cache._entries) == 2 and cache.stats["rejected"] == 1
+
+        # Once one finishes, its slot can be reused
+        cache.complete(("u", "a"), "bid-a")
+        cache.reserve("u", "c")
+        assert list(cache._entries) == [("u", "b"), ("u", "c")]
+
+    asyncio.run(run())
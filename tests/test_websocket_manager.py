@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+
+from broadcast_bus import InProcessBus
+from websocket_manager import WS_HEARTBEAT_INTERVAL, ConnectionManager
+from wire_format import Frame
+
+class StalledWebSocket:
+    """A client that never reads, so everything sent to it stays queued"""
+
+    def __init__(self):
+        self.scope = {}
+        self.closed = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        await asyncio.Event().wait()
+
+    async def close(self, code=1000):
+        self.closed = code
+
+def test_heartbeat_drops_slow_consumers_without_breaking_the_pass():
+    async def run():
+        manager = ConnectionManager(InProcessBus())
+        connections = [await manager.connect(StalledWebSocket(), f"user-{i}") for i in range(3)]
+        for connection in connections:
+            connection.max_queue = 1
+            connection.enqueue(Frame({"type": "bid_update"}))
+        await asyncio.sleep(0)
+        # The writers are stuck sending the first frame; the second fills the queue
+        for connection in connections:
+            assert connection.enqueue(Frame({"type": "bid_update"}))
+
+        # Every idle connection is due a ping that no longer fits in its queue
+        manager._check_heartbeats(time.monotonic() + WS_HEARTBEAT_INTERVAL)
+        await asyncio.sleep(0)
+
+        assert manager.stats["heartbeat_pings"] == 3
+        assert manager.stats["slow_consumer_disconnects"] == 3
+        assert not manager.connections and not manager._activity
+        assert all(connection.websocket.closed == 1013 for connection in connections)
+
+    asyncio.run(run())
+
+class RecordingWebSocket(StalledWebSocket):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def send_text(self, data):
+        self.sent.append(json.loads(data))
+
+def test_snapshot_covers_events_published_while_it_was_built():
+    async def run():
+        manager = ConnectionManager(InProcessBus())
+        websocket = RecordingWebSocket()
+        connection = await manager.connect(websocket, "user-1")
+
+        async def snapshot(auction_id):
+            await manager.broadcast_to_auction(auction_id, {"type": "bid_update", "auction_id": auction_id})
+            return {"current_bid": 150}
+        manager.snapshot_provider = snapshot
+
+        # A stream id this worker never issued forces a snapshot
+        await manager.join_auction(connection, "A", "user", last_seq=7, stream_id="elsewhere")
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+        sent = [(message["type"], message.get("seq")) for message in websocket.sent]
+        assert sent == [("auction_joined", 0), ("bid_update", 1), ("auction_snapshot", 1)]
+
+    asyncio.run(run())
+
+class GatedWebSocket(RecordingWebSocket):
+    """Records frames, but each send waits until the gate opens"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = asyncio.Event()
+
+    async def send_text(self, data):
+        await self.gate.wait()
+        await super().send_text(data)
+
+def test_broadcast_wakes_idle_writers_after_returning_and_busy_ones_drain_alone():
+    async def run():
+        manager = ConnectionManager(InProcessBus())
+        idle, busy = RecordingWebSocket(), GatedWebSocket()
+        for i, websocket in enumerate((idle, busy)):
+            connection = await manager.connect(websocket, f"user-{i}")
+            await manager.join_auction(connection, "A", f"user-{i}")
+        await asyncio.sleep(0)
+        idle.sent.clear()
+
+        await manager.broadcast_to_auction("A", {"type": "bid_update", "amount": 1})
+        assert not idle.sent
+        await manager.broadcast_to_auction("A", {"type": "bid_update", "amount": 2})
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert [m["amount"] for m in idle.sent] == [1, 2]
+
+        busy.gate.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert [m["amount"] for m in busy.sent if m["type"] == "bid_update"] == [1, 2]
+
+    asyncio.run(run())
@@ -0,0 +1,14 @@
+import time
+
+from ws_router import WebSocketSession
+
+def test_session_expires_with_its_token():
+    session = WebSocketSession(connection=None, user=object(), expires_at=time.time() + 60)
+    assert not session.expired()
+
+    session.expires_at = time.time() - 1
+    assert session.expired()
+
+    # A token without "exp" never expires the session
+    session.expires_at = None
+    assert not session.expired()